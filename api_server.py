@@ -0,0 +1,273 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from neural_engine import (
+    LOW_CONFIDENCE_REPLY, MIN_RETRIEVAL_SCORE, NeuralEngine, SafetySystem, build_search_query
+)
+
+# Headless JSON API around NeuralEngine (stdlib asyncio, no web framework).
+# The event loop only parses requests; encode/generate run on WORKERS threads.
+HOST = "127.0.0.1"
+PORT = 8000
+# Concurrent generate() callers are what the batch scheduler groups together,
+# so keep this at least MAX_BATCH_SIZE
+WORKERS = 8
+# Requests admitted to the pool (running + queued); beyond this the server
+# answers 503 at once instead of letting latency grow without bound
+MAX_PENDING = 64
+REQUEST_TIMEOUT_S = 60
+MAX_BODY_BYTES = 64 * 1024
+MAX_MESSAGE_CHARS = 2000
+MAX_RETRIEVE_K = 20
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _text_field(payload, name, max_chars=MAX_MESSAGE_CHARS):
+    value = payload.get(name)
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPError(400, f"'{name}' must be a non-empty string")
+    if len(value) > max_chars:
+        raise HTTPError(413, f"'{name}' is longer than {max_chars} characters")
+    return value
+
+
+class ApiServer:
+    """Routes JSON requests to the engine with a bounded worker pool.
+
+    Timed-out requests get a 504 but keep their worker until generate()
+    returns, and stay counted against MAX_PENDING until then.
+    """
+
+    def __init__(self, engine, safety, workers=WORKERS, max_pending=MAX_PENDING, timeout=REQUEST_TIMEOUT_S):
+        self.engine = engine
+        self.safety = safety
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.routes = {
+            ("POST", "/chat"): self.chat,
+            ("POST", "/retrieve"): self.retrieve,
+            ("POST", "/scan"): self.scan,
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.metrics,
+        }
+
+    # --- ENDPOINTS ---
+    async def chat(self, payload):
+        """{"message": str, "history": [{"role", "content"}, ...]} -> reply."""
+        message = _text_field(payload, "message")
+        history = payload.get("history") or []
+        if not isinstance(history, list) or not all(
+                isinstance(m, dict) and isinstance(m.get("content"), str) for m in history):
+            raise HTTPError(400, "'history' must be a list of {\"role\", \"content\"} messages")
+        # Crisis messages are answered on the event loop, never queued behind generation
+        alert = self.safety.scan(message)
+        if alert:
+            return {"reply": alert, "alert": True}
+        self._require_retrieval()
+        return await self._offload(self._chat, message, history)
+
+    async def retrieve(self, payload):
+        """{"query": str, "k": int} -> the k closest entries with their sanitized advice."""
+        query = _text_field(payload, "query")
+        k = payload.get("k", 1)
+        if not isinstance(k, int) or not 1 <= k <= MAX_RETRIEVE_K:
+            raise HTTPError(400, f"'k' must be an integer from 1 to {MAX_RETRIEVE_K}")
+        self._require_retrieval()
+        return await self._offload(self._retrieve, query, k)
+
+    async def scan(self, payload):
+        alert = self.safety.scan(_text_field(payload, "text"))
+        return {"alert": alert is not None, "message": alert}
+
+    async def health(self, payload):
+        return {
+            "status": "ok" if self.engine.generator_ready.is_set() else "loading",
+            "retrieval_ready": self.engine.retrieval_ready.is_set(),
+            "generator_ready": self.engine.generator_ready.is_set(),
+            "load_error": str(self.engine.load_error) if self.engine.load_error else None,
+            "startup_times": self.engine.startup_times,
+            "pending": self.pending,
+            "workers": self.workers,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "retrieval": self.engine.retrieval_stats(),
+            "decoding": self.engine.decoding_stats(),
+        }
+
+    async def metrics(self, payload):
+        return self.engine.tracer.prometheus_text()
+
+    # --- WORKER CALLS ---
+    def _chat(self, message, history):
+        retrieval_only = not self.engine.generator_ready.is_set()
+        with self.engine.tracer.trace("message") as trace:
+            messages = history + [{"role": "user", "content": message}]
+            advice, score = self.engine.retrieve(build_search_query(messages, message), message)
+            if score < MIN_RETRIEVAL_SCORE:
+                reply = LOW_CONFIDENCE_REPLY
+            else:
+                reply, _ = self.engine.generate_response(message, advice)
+        return {
+            "reply": reply,
+            "alert": False,
+            "score": score,
+            "retrieval_only": retrieval_only,
+            "total_ms": trace.total_ms,
+        }
+
+    def _retrieve(self, query, k):
+        ids, scores = self.engine.search(query, k=k)
+        return {"results": [
+            {"id": int(i), "score": float(s), "advice": self.engine._clean_response(int(i))}
+            for i, s in zip(ids, scores)
+        ]}
+
+    def _require_retrieval(self):
+        if self.engine.retrieval_ready.is_set():
+            return
+        if self.engine.loading_done.is_set():
+            raise HTTPError(503, f"model loading failed: {self.engine.load_error}")
+        raise HTTPError(503, "models are still loading")
+
+    async def _offload(self, fn, *args):
+        """Run `fn` on the pool, refusing work past max_pending and timing out slow calls."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPError(503, "server busy, retry later")
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        future = loop.run_in_executor(self.pool, fn, *args)
+        # Released when the worker actually finishes, not when the client gives up
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPError(504, f"no reply within {self.timeout}s")
+
+    def _release(self, future):
+        self.pending -= 1
+
+    # --- HTTP ---
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one keep-alive connection until the client closes it."""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._respond(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, result = await self._dispatch(method, path, body)
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"body larger than {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method, path, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.routes):
+                return 405, {"error": f"{method} not allowed on {path}"}
+            return 404, {"error": f"no endpoint {path}"}
+        try:
+            payload = json.loads(body) if body else {}
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "body must be a JSON object")
+            return 200, await handler(payload)
+        except json.JSONDecodeError:
+            return 400, {"error": "body is not valid JSON"}
+        except HTTPError as e:
+            return e.status, {"error": e.message}
+        except Exception as e:
+            print(f"❌ {method} {path} failed: {e!r}")
+            return 500, {"error": "internal error"}
+
+    async def _respond(self, writer, status, result, keep_alive):
+        if isinstance(result, str):
+            body, content_type = result.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(result, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host=HOST, port=PORT, workers=WORKERS, max_pending=MAX_PENDING, timeout=REQUEST_TIMEOUT_S):
+    # Models load in the background; /health reports when they are ready
+    engine = NeuralEngine(progress=print, background=True)
+    api = ApiServer(engine, SafetySystem(), workers, max_pending, timeout)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    print(f"🌐 Serving on http://{host}:{port} ({workers} workers, max {max_pending} pending)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless HTTP API for the therapy bot.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT_S)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending, args.timeout))
+    except KeyboardInterrupt:
+        print("👋 Server stopped.")
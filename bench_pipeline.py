@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import psutil
+
+from ingest import KnowledgeStore
+from neural_engine import (
+    LOW_CONFIDENCE_REPLY, MIN_RETRIEVAL_SCORE, NeuralEngine, SafetySystem, build_search_query
+)
+from tracing import Tracer, percentile
+
+# Offline end-to-end benchmark: replays multi-turn conversations through
+# SafetySystem.scan -> context construction -> retrieve -> generate_response
+# using tiny locally built stand-in models and a synthetic DB, so it needs
+# no network and no model downloads.
+CONVERSATIONS_FILE = "bench_conversations.jsonl"
+# first_token is only measured with --stream
+STAGES = ["safety", "context", "retrieve", "generate", "first_token", "turn"]
+SEED = 0
+
+# Vocabulary of the synthetic corpus and the stand-in tokenizer
+WORDS = """
+anxious anxiety panic worry worried fear scared nervous stress stressed overwhelmed calm breathe breathing
+sad sadness depressed depression lonely alone empty tired exhausted hopeless numb cry crying tears grief loss
+angry anger mad furious frustrated annoyed resentful blame unfair argue argument fight conflict
+sleep insomnia awake night racing thoughts overthinking rumination bed morning energy motivation
+job work boss career school exam exams study grades money bills family parents partner friend friends
+relationship marriage divorce breakup dating lonely city moved new people social confidence shame guilt
+failure failing stupid useless worthless compare comparing perfect mistake mistakes criticism judged
+feel feeling feelings emotion emotions thought thinking mind body heart chest tight shaking sweating
+help support listen talk share understand notice name accept allow try practice small step steps goal
+plan routine walk exercise journal write list gratitude kindness compassion boundary boundaries ask need
+you your i me my we us they them it this that what when how why which can could would should will
+is are was were be been being have has had do does did not no yes maybe sometimes always never often
+and or but so because if then also just really very more less much many some any every each
+a an the of to in on at for with about from into over after before during through between
+""".split()
+
+
+# --- STAND-IN MODELS ---
+class HashingEncoder:
+    """Bag-of-words hashing encoder standing in for the MiniLM retriever."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        if single: texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for tok in re.findall(r"\w+", text.lower()):
+                # crc32 rather than hash(): stable across processes
+                h = zlib.crc32(tok.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+def build_tiny_generator(words):
+    """Word-level tokenizer and a randomly initialized 2-layer T5."""
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+    vocab = {w: i for i, w in enumerate(["<pad>", "</s>", "<unk>"] + sorted(set(words)))}
+    backend = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    backend.post_processor = processors.TemplateProcessing(single="$A </s>", special_tokens=[("</s>", 1)])
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend, pad_token="<pad>", eos_token="</s>", unk_token="<unk>"
+    )
+
+    torch.manual_seed(SEED)
+    config = T5Config(
+        vocab_size=len(vocab), d_model=64, d_kv=16, d_ff=128, num_layers=2, num_decoder_layers=2,
+        num_heads=4, pad_token_id=0, eos_token_id=1, decoder_start_token_id=0
+    )
+    return tokenizer, T5ForConditionalGeneration(config).eval()
+
+
+class StandInEngine(NeuralEngine):
+    model_name = "tiny-t5-standin"
+    retriever_name = "hashing-standin"
+
+    def _load_retriever(self):
+        return HashingEncoder()
+
+    def _load_generator(self):
+        return build_tiny_generator(WORDS)
+
+
+# --- SYNTHETIC DATA ---
+def write_synthetic_db(path, size, rng):
+    def sentence(lo, hi):
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(lo, hi)))
+
+    store = KnowledgeStore(path)
+    store.append(
+        {"patterns": [sentence(3, 12) for _ in range(rng.randint(1, 3))],
+         "response": sentence(15, 60), "source": "synthetic"}
+        for _ in range(size)
+    )
+    return len(store)
+
+
+def load_conversations(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line)["turns"] for line in f if line.strip()]
+
+
+class PeakRSS:
+    """Samples the process RSS in the background and keeps the maximum."""
+
+    def __init__(self, interval=0.02):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        proc = psutil.Process()
+        while not self._stop.is_set():
+            self.peak = max(self.peak, proc.memory_info().rss)
+            self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.peak / 2**20
+
+
+# --- REPLAY ---
+def replay(engine, safety, turns, timings, lock, stream=False):
+    messages = [{"role": "assistant", "content": "Hello. I am here to listen. How are you feeling?"}]
+    for prompt in turns:
+        turn_start = time.perf_counter()
+        samples = {}
+        messages.append({"role": "user", "content": prompt})
+
+        start = time.perf_counter()
+        alert = safety.scan(prompt)
+        samples["safety"] = time.perf_counter() - start
+        if alert:
+            # The UI stops the conversation here
+            with lock:
+                timings["blocked"] += 1
+            return
+
+        start = time.perf_counter()
+        search_query = build_search_query(messages, prompt)
+        samples["context"] = time.perf_counter() - start
+
+        # Lexical fast path or encode + similarity search
+        start = time.perf_counter()
+        advice, score = engine.retrieve(search_query, prompt)
+        samples["retrieve"] = time.perf_counter() - start
+
+        if score < MIN_RETRIEVAL_SCORE:
+            reply = LOW_CONFIDENCE_REPLY
+        elif stream:
+            # The UI's default path: consumed token by token like the chat bubble
+            start = time.perf_counter()
+            reply_stream = engine.stream_response(prompt, advice)
+            for partial in reply_stream:
+                if partial and "first_token" not in samples:
+                    samples["first_token"] = time.perf_counter() - start
+            reply = reply_stream.text
+            samples["generate"] = time.perf_counter() - start
+        else:
+            start = time.perf_counter()
+            reply, _ = engine.generate_response(prompt, advice)
+            samples["generate"] = time.perf_counter() - start
+        messages.append({"role": "assistant", "content": reply})
+
+        samples["turn"] = time.perf_counter() - turn_start
+        with lock:
+            for stage, seconds in samples.items():
+                timings[stage].append(seconds * 1000)
+
+
+def smoke_stream(engine, prompt, advice, timeout=60):
+    """Stream one reply to the end; fails instead of hanging if the stream never finishes."""
+    result = {}
+
+    def run():
+        try:
+            stream = engine.stream_response(prompt, advice)
+            for _ in stream:
+                pass
+            result["text"] = stream.text
+        except Exception as e:
+            result["error"] = e
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        raise RuntimeError(f"stream_response did not finish within {timeout}s")
+    if "error" in result:
+        raise result["error"]
+    return result["text"]
+
+
+def measure(size, conversations_file, concurrency, use_caches, use_lexical, decoding, budget_ms, stream):
+    rng = random.Random(SEED)
+    conversations = load_conversations(conversations_file)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench_db.jsonl")
+        kb_file = os.path.join(tmp, "bench_db.kb")
+        write_synthetic_db(db_file, size, rng)
+
+        # In-memory tracer so the benchmark leaves no metrics files behind
+        tracer = Tracer()
+        rss = PeakRSS()
+        # Cold start as the UI does it: background loading, first reply as soon as retrieval is up
+        start = time.perf_counter()
+        engine = StandInEngine(db_file=db_file, kb_file=kb_file, tracer=tracer, background=True, index_file=None)
+        engine.wait_until_ready("retrieval")
+        first_prompt = conversations[0][0]
+        engine.generate_response(first_prompt, engine.retrieve(first_prompt)[0] or "")
+        first_reply_s = time.perf_counter() - start
+        engine.wait_until_ready("generator")
+        startup_cold_s = time.perf_counter() - start
+        # The UI streams by default; make sure a streamed reply completes
+        smoke_stream(engine, first_prompt, engine.retrieve(first_prompt)[0] or "")
+        cold_times = dict(engine.startup_times)
+        # Second start reuses the on-disk embedding cache
+        start = time.perf_counter()
+        engine = StandInEngine(db_file=db_file, kb_file=kb_file, tracer=tracer, index_file=None)
+        startup_warm_s = time.perf_counter() - start
+        if not use_caches:
+            engine.query_cache = engine.reply_pool = None
+        if not use_lexical:
+            engine.lexical = None
+        engine.decoding.adaptive = decoding == "adaptive"
+        if budget_ms is not None:
+            engine.decoding.budget_ms = budget_ms
+        safety = SafetySystem(tracer=tracer)
+
+        timings = {stage: [] for stage in STAGES}
+        timings["blocked"] = 0
+        lock = threading.Lock()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda turns: replay(engine, safety, turns, timings, lock, stream), conversations))
+        wall_s = time.perf_counter() - start
+        peak_mb = rss.stop()
+
+    return {
+        "entries": size,
+        "startup_cold_s": startup_cold_s,
+        "startup_warm_s": startup_warm_s,
+        "retrieval_ready_s": cold_times["retrieval_ready"],
+        "first_reply_s": first_reply_s,
+        "turns": len(timings["turn"]),
+        "blocked": timings["blocked"],
+        "throughput_tps": len(timings["turn"]) / wall_s if wall_s else 0.0,
+        "peak_rss_mb": peak_mb,
+        "retrieval": engine.retrieval_stats(),
+        "decoding": engine.decoding_stats(),
+        "stages": {
+            stage: {p: percentile(timings[stage], p) for p in (50, 95, 99)} for stage in STAGES if timings[stage]
+        },
+    }
+
+
+def print_report(r):
+    print(f"\n📊 {r['entries']} entries: startup {r['startup_cold_s']:.2f}s cold / {r['startup_warm_s']:.2f}s warm, "
+          f"retrieval ready {r['retrieval_ready_s']:.2f}s, first reply {r['first_reply_s']:.2f}s, "
+          f"{r['turns']} turns ({r['blocked']} blocked by safety), "
+          f"{r['throughput_tps']:.2f} turns/s, peak RSS {r['peak_rss_mb']:.0f} MB")
+    print(f"   {'stage':<11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, p in r["stages"].items():
+        print(f"   {stage:<11} {p[50]:>9.2f} {p[95]:>9.2f} {p[99]:>9.2f}")
+    lex = r["retrieval"]
+    if lex and lex["fast_path"]:
+        saved = f", {lex['saved_ms']:.0f} ms saved" if lex["saved_ms"] is not None else ""
+        print(f"   lexical fast path: {lex['fast_fraction']:.0%} of searches "
+              f"({lex['fast_ms']:.2f} ms vs {lex['neural_ms'] or 0:.2f} ms neural{saved})")
+    for tier, d in r["decoding"].items():
+        passed = f"{d['pass_rate']:.0%}" if d["pass_rate"] is not None else "n/a"
+        print(f"   decoding {tier:<6} {d['calls']:>4} calls, generate p50 {d['latency_ms_p50']:.1f} ms / "
+              f"p95 {d['latency_ms_p95']:.1f} ms, {d['avg_steps']:.0f} tokens, "
+              f"{d['early_stop_rate']:.0%} stopped early, {passed} pass quality")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark with stand-in models.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--conversations", default=CONVERSATIONS_FILE)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--no-cache", action="store_true", help="disable query/reply caches")
+    parser.add_argument("--no-lexical", action="store_true", help="disable the BM25 fast path and hybrid scoring")
+    parser.add_argument("--decoding", choices=["adaptive", "fixed"], default="adaptive",
+                        help="decoding policy; fixed always uses GENERATION_KWARGS")
+    parser.add_argument("--budget-ms", type=float, help="latency budget per generate() call (default: LATENCY_BUDGET_MS)")
+    parser.add_argument("--stream", action="store_true", help="stream replies (the UI default) instead of generate_response")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.conversations, args.concurrency,
+                                 not args.no_cache, not args.no_lexical, args.decoding, args.budget_ms, args.stream)))
+        sys.exit()
+
+    results = []
+    for size in args.sizes:
+        # Fresh interpreter per size so startup and peak RSS are not shared
+        cmd = [sys.executable, __file__, "--child", str(size), "--conversations", args.conversations,
+               "--concurrency", str(args.concurrency)]
+        if args.no_cache: cmd.append("--no-cache")
+        if args.no_lexical: cmd.append("--no-lexical")
+        if args.stream: cmd.append("--stream")
+        cmd += ["--decoding", args.decoding]
+        if args.budget_ms is not None: cmd += ["--budget-ms", str(args.budget_ms)]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.splitlines()[-1])
+        # json turns the percentile keys into strings
+        result["stages"] = {s: {int(k): v for k, v in p.items()} for s, p in result["stages"].items()}
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,100 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import psutil
+
+# Latency / memory / quality report per inference precision on a fixed prompt set.
+# Every mode runs in a fresh interpreter so model memory is measured in isolation.
+MODES = [
+    ("fp32", "fp32"),
+    ("int8", "fp32"),
+    ("fp32", "int8"),
+    ("int8", "int8"),
+    ("bf16", "fp32"),
+]
+
+PROMPTS = [
+    "hi",
+    "I feel anxious about my job",
+    "I can't sleep at night, my thoughts keep racing",
+    "My partner and I argue all the time",
+    "I feel like a failure at everything",
+    "I'm so tired I can't get out of bed",
+    "Everyone at school hates me",
+    "I get panic attacks before exams",
+    "I'm angry at my parents for how they treated me",
+    "How do I stop overthinking?",
+    "I feel lonely since I moved to a new city",
+    "Nothing seems to matter anymore",
+]
+
+
+def measure(generator_precision, retriever_precision, num_threads):
+    from tracing import percentile
+    from neural_engine import NeuralEngine
+
+    start = time.perf_counter()
+    engine = NeuralEngine(generator_precision=generator_precision,
+                          retriever_precision=retriever_precision, num_threads=num_threads)
+    load_s = time.perf_counter() - start
+    # Compare the encoders themselves: BM25 hits would look identical across precisions
+    engine.lexical = None
+
+    retrieve_ms, generate_ms, top_ids = [], [], []
+    accepted = total = 0
+    for prompt in PROMPTS:
+        start = time.perf_counter()
+        ids, _ = engine.search(prompt)
+        retrieve_ms.append((time.perf_counter() - start) * 1000)
+        if not len(ids):
+            continue
+        top_ids.append(int(ids[0]))
+        advice = engine._clean_response(int(ids[0]))
+
+        start = time.perf_counter()
+        candidates = engine._generate(engine._build_prompt(prompt, advice))
+        generate_ms.append((time.perf_counter() - start) * 1000)
+        total += len(candidates)
+        accepted += sum(engine._verify_quality(engine._clean_artifacts(c)) for c in candidates)
+
+    return {
+        "mode": f"{generator_precision}/{retriever_precision}",
+        "load_s": load_s,
+        "rss_mb": psutil.Process().memory_info().rss / 2**20,
+        "retrieve_ms_p50": percentile(retrieve_ms, 50),
+        "generate_ms_p50": percentile(generate_ms, 50),
+        "generate_ms_p95": percentile(generate_ms, 95),
+        "acceptance": accepted / total if total else 0.0,
+        "top_ids": top_ids,
+    }
+
+
+def run_benchmark(modes, num_threads):
+    print(f"📊 Precision report over {len(PROMPTS)} prompts (threads: {num_threads or 'default'})")
+    print(f"   {'gen/ret':<10} {'load s':>7} {'RSS MB':>7} {'ret p50':>8} {'gen p50':>8} {'gen p95':>8} "
+          f"{'agree':>6} {'accept':>7}")
+    baseline = None
+    for gen, ret in modes:
+        cmd = [sys.executable, __file__, "--child", gen, ret]
+        if num_threads: cmd += ["--threads", str(num_threads)]
+        r = json.loads(subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+        # Retrieval agreement is measured against the first mode (fp32/fp32)
+        if baseline is None: baseline = r["top_ids"]
+        agree = sum(a == b for a, b in zip(r["top_ids"], baseline)) / len(baseline) if baseline else 0.0
+        print(f"   {r['mode']:<10} {r['load_s']:>7.1f} {r['rss_mb']:>7.0f} {r['retrieve_ms_p50']:>8.1f} "
+              f"{r['generate_ms_p50']:>8.0f} {r['generate_ms_p95']:>8.0f} {agree:>6.0%} {r['acceptance']:>7.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency, memory and quality across inference precisions.")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--child", nargs=2, metavar=("GEN", "RET"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(*args.child, args.threads)))
+    else:
+        run_benchmark(MODES, args.threads)
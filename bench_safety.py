@@ -0,0 +1,76 @@
+import os
+import random
+import string
+import time
+
+from safety_matcher import PhraseMatcher, load_lexicon
+
+# Micro-benchmark: per-message scan cost as the crisis lexicon grows
+LEXICON_SIZES = [10, 100, 1000, 10000, 50000]
+MESSAGES = 2000
+SEED = 0
+LEXICON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_lexicon.txt")
+# Caught by the old substring scan; whole-word matching needs each form listed
+MUST_FLAG = [
+    "I overdosed last night", "thinking about overdosing", "there were killings in the news",
+    "the killers are still out there", "he killed it", "she kills time", "my self-harms are getting worse",
+    "I am a self-harmer", "self-harmers like me", "I self harmed again", "suicides in my family",
+    "I feel suicidal", "I want to end my life", "everyone would be better off dead",
+]
+# Substring hits the whole-word matcher is meant to drop
+MUST_NOT_FLAG = ["my cooking skills are bad", "a skillet of eggs", "the office was cold"]
+
+
+def random_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+
+
+def make_lexicon(rng, size):
+    return [" ".join(random_word(rng) for _ in range(rng.randint(1, 3))) for _ in range(size)]
+
+
+def make_messages(rng, count):
+    return [" ".join(random_word(rng) for _ in range(rng.randint(5, 40))) for _ in range(count)]
+
+
+def time_per_message(scan, messages):
+    start = time.perf_counter()
+    for msg in messages:
+        scan(msg)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def check_lexicon(path=LEXICON_FILE):
+    """Regression check of the shipped lexicon against known crisis messages."""
+    matcher = PhraseMatcher(load_lexicon(path))
+    missed = [m for m in MUST_FLAG if matcher.search(m) is None]
+    wrong = [m for m in MUST_NOT_FLAG if matcher.search(m) is not None]
+    for m in missed:
+        print(f"❌ Not flagged: {m!r}")
+    for m in wrong:
+        print(f"❌ Flagged: {m!r}")
+    if missed or wrong:
+        raise SystemExit(1)
+    print(f"✅ Lexicon check: {len(MUST_FLAG)} crisis messages flagged, {len(MUST_NOT_FLAG)} others not")
+
+
+def run_benchmark():
+    rng = random.Random(SEED)
+    messages = make_messages(rng, MESSAGES)
+    print(f"📊 Scan cost per message ({MESSAGES} messages, 5-40 words each)")
+    print(f"   {'phrases':>8} {'build ms':>9} {'matcher µs':>11} {'substring µs':>13}")
+    for size in LEXICON_SIZES:
+        lexicon = make_lexicon(rng, size)
+        start = time.perf_counter()
+        matcher = PhraseMatcher(lexicon)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # The old approach: one `in` test per keyword
+        naive = lambda text: any(word in text.lower() for word in lexicon)
+        print(f"   {size:>8} {build_ms:>9.1f} {time_per_message(matcher.search, messages):>11.1f} "
+              f"{time_per_message(naive, messages[:200]):>13.1f}")
+
+
+if __name__ == "__main__":
+    check_lexicon()
+    run_benchmark()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import psutil
+
+from ingest import DB_FILE
+from kb_format import KB_FILE
+
+# Startup time and memory of the JSON knowledge base vs the binary format.
+# Each format is measured in a fresh interpreter so their RSS don't mix.
+RETRIEVALS = 20
+
+
+def _rss_mb():
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def measure(fmt, db_file, kb_file):
+    import random
+    from kb_format import BinaryKnowledgeBase, JsonKnowledgeBase
+    from ingest import load_entries
+
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    kb = BinaryKnowledgeBase(kb_file) if fmt == "binary" else JsonKnowledgeBase(load_entries(db_file))
+    corpus_text = kb.pattern_texts()
+    startup_s = time.perf_counter() - start
+
+    # What a session does afterwards: fetch one response per retrieved entry
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(RETRIEVALS):
+        i = rng.randrange(len(kb))
+        kb.clean_response(i) or kb.response(i)
+    lookup_ms = (time.perf_counter() - start) * 1000 / RETRIEVALS
+
+    return {
+        "format": fmt,
+        "entries": len(corpus_text),
+        "startup_s": startup_s,
+        "lookup_ms": lookup_ms,
+        "rss_mb": _rss_mb() - rss_before,
+    }
+
+
+def run_benchmark(db_file, kb_file):
+    print(f"📊 Knowledge base startup ({db_file} vs {kb_file})")
+    print(f"   {'format':<8} {'entries':>8} {'startup s':>10} {'lookup ms':>10} {'RSS +MB':>8}")
+    for fmt in ("json", "binary"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", fmt, "--db", db_file, "--kb", kb_file],
+            capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(out)
+        print(f"   {r['format']:<8} {r['entries']:>8} {r['startup_s']:>10.3f} {r['lookup_ms']:>10.3f} {r['rss_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark knowledge base startup time and RSS.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--kb", default=KB_FILE)
+    parser.add_argument("--child", choices=["json", "binary"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.db, args.kb)))
+    else:
+        run_benchmark(args.db, args.kb)
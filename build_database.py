@@ -1,4 +1,4 @@
-import json
+from ingest import DB_FILE, KnowledgeStore
 
 data = [
     # --- GENERAL / GREETINGS ---
@@ -86,7 +86,7 @@ data = [
     }
 ]
 
-with open("mindfulness_db.json", "w") as f:
-    json.dump(data, f, indent=2)
+# Appended next to any imported data; entries already present are skipped
+added = KnowledgeStore(DB_FILE).append(data)
 
-print("Database rebuilt successfully with 50+ patterns!")
\ No newline at end of file
+print(f"Database updated successfully: {added} of {len(data)} seed entries added!")
\ No newline at end of file
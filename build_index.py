@@ -0,0 +1,163 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import time
+
+import numpy as np
+
+from ingest import DB_FILE
+from kb_format import KB_FILE, open_knowledge_base
+
+# Offline corpus embedding: run after ingest so the bot only loads the result.
+INDEX_FILE = "mindfulness_db.index"
+INDEX_FORMAT_VERSION = 1
+# Texts handed to a worker at a time; finished chunks go straight to disk
+CHUNK_SIZE = 2048
+ENCODE_BATCH_SIZE = 128
+
+
+def corpus_hash(texts):
+    """Hash of the embedded texts in order; any edit, insert or reorder changes it."""
+    h = hashlib.sha1()
+    for text in texts:
+        h.update(text.encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def load_index_artifact(path=INDEX_FILE):
+    """(meta, memory-mapped embeddings) of a built index; ValueError if unreadable."""
+    try:
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"cannot read index artifact: {e}")
+    if meta.get("format") != INDEX_FORMAT_VERSION:
+        raise ValueError(f"format {meta.get('format')}, expected {INDEX_FORMAT_VERSION}")
+    if embeddings.shape != (meta.get("count"), meta.get("dim")):
+        raise ValueError(f"embeddings shape {embeddings.shape} does not match meta.json")
+    return meta, embeddings
+
+
+def artifact_mismatch(meta, model_key, texts):
+    """Why an artifact cannot serve this corpus and retriever, or None if it can."""
+    if meta.get("model") != model_key:
+        return f"built with {meta.get('model')}, retriever is {model_key}"
+    if meta.get("count") != len(texts):
+        return f"has {meta.get('count')} entries, knowledge base has {len(texts)}"
+    if meta.get("corpus_hash") != corpus_hash(texts):
+        return "knowledge base changed since it was built"
+    return None
+
+
+# --- WORKERS ---
+_worker_model = None
+
+
+def _init_worker(model_name, precision, threads):
+    global _worker_model
+    import torch
+    from neural_engine import load_retriever
+    # Split the cores between processes instead of every worker using all of them
+    torch.set_num_threads(threads)
+    _worker_model = load_retriever(model_name, precision)
+
+
+def _encode_chunk(task):
+    start, texts = task
+    vectors = _worker_model.encode(texts, batch_size=ENCODE_BATCH_SIZE,
+                                   convert_to_numpy=True, normalize_embeddings=True)
+    return start, np.asarray(vectors, dtype=np.float32)
+
+
+def encode_parallel(texts, model_name, precision, workers, out_file=None, chunk_size=CHUNK_SIZE):
+    """Encode `texts` across `workers` processes; with `out_file` rows go straight to a .npy memmap."""
+    out = None
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    tasks = ((i, texts[i:i + chunk_size]) for i in range(0, len(texts), chunk_size))
+    # spawn: each worker imports torch itself instead of inheriting a forked copy
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(model_name, precision, threads)) as pool:
+        for start, vectors in pool.imap_unordered(_encode_chunk, tasks):
+            if out is None:
+                shape = (len(texts), vectors.shape[1])
+                out = (np.lib.format.open_memmap(out_file, mode="w+", dtype=np.float32, shape=shape)
+                       if out_file else np.empty(shape, dtype=np.float32))
+            out[start:start + len(vectors)] = vectors
+    if out_file:
+        out.flush()
+    return out
+
+
+def build_index_artifact(db_file=DB_FILE, kb_file=KB_FILE, output=INDEX_FILE, model_name=None,
+                         precision=None, workers=None):
+    """Encode the knowledge base and write embeddings, ids and meta.json to `output`."""
+    from neural_engine import RETRIEVER_NAME, RETRIEVER_PRECISION, embedding_model_key
+    model_name = model_name or RETRIEVER_NAME
+    precision = precision or RETRIEVER_PRECISION
+    workers = workers or os.cpu_count() or 1
+
+    kb = open_knowledge_base(db_file, kb_file)
+    texts = kb.pattern_texts()
+    if not texts:
+        raise ValueError(f"{db_file} has no entries to index")
+    print(f"🧱 Encoding {len(texts)} entries with {model_name} ({precision}) on {workers} workers...")
+
+    # Written next to the target and swapped in at the end, so a failed build
+    # never leaves a half-written artifact for the bot to load
+    tmp = output + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    start = time.perf_counter()
+    embeddings = encode_parallel(texts, model_name, precision, workers,
+                                 out_file=os.path.join(tmp, "embeddings.npy"))
+    elapsed = time.perf_counter() - start
+    dim = int(embeddings.shape[1])
+    del embeddings
+
+    ids = [kb.extra(i).get("id", "") for i in range(len(kb))]
+    np.save(os.path.join(tmp, "ids.npy"), np.array(ids, dtype="S32"))
+    with open(os.path.join(tmp, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "format": INDEX_FORMAT_VERSION,
+            "model": embedding_model_key(model_name, precision),
+            "count": len(texts),
+            "dim": dim,
+            "corpus_hash": corpus_hash(texts),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, f, indent=2)
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(tmp, output)
+    print(f"✅ Wrote {output}: {len(texts) / elapsed:.0f} entries/s ({elapsed:.1f}s)")
+    return len(texts) / elapsed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the corpus embedding index offline.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--kb", default=KB_FILE)
+    parser.add_argument("--output", default=INDEX_FILE)
+    parser.add_argument("--model", help="retriever model (default: RETRIEVER_NAME)")
+    parser.add_argument("--precision", help="retriever precision (default: RETRIEVER_PRECISION)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--scaling", type=int, nargs="+",
+                        help="also report entries/sec for these worker counts on a sample")
+    parser.add_argument("--sample", type=int, default=10000, help="entries encoded per --scaling run")
+    args = parser.parse_args()
+
+    build_index_artifact(args.db, args.kb, args.output, args.model, args.precision, args.workers)
+
+    if args.scaling:
+        from neural_engine import RETRIEVER_NAME, RETRIEVER_PRECISION
+        texts = open_knowledge_base(args.db, args.kb).pattern_texts()[:args.sample]
+        print(f"📊 Build throughput on {len(texts)} entries (includes model load per worker)")
+        print(f"   {'workers':>7} {'entries/s':>10}")
+        for workers in args.scaling:
+            start = time.perf_counter()
+            encode_parallel(texts, args.model or RETRIEVER_NAME, args.precision or RETRIEVER_PRECISION, workers)
+            print(f"   {workers:>7} {len(texts) / (time.perf_counter() - start):>10.0f}")
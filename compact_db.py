@@ -0,0 +1,197 @@
+import argparse
+import os
+import shutil
+import time
+import zlib
+
+import numpy as np
+
+from ingest import DB_FILE, KnowledgeStore, entry_id, iter_entries
+from safety_matcher import tokenize
+from vector_index import ExactIndex
+
+# Near duplicates: MinHash signatures over word shingles, bucketed with LSH
+# (BANDS x ROWS = NUM_PERM) so only entries sharing a band are compared.
+# With 16 bands of 4 rows, pairs above ~0.5 Jaccard are very likely to meet.
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 3
+NEAR_THRESHOLD = 0.8     # exact Jaccard on shingles a candidate pair must reach
+MIN_NEAR_WORDS = 5       # keyword entries ("hi", "can't cope") are only merged when identical
+MAX_BUCKET_COMPARE = 50  # bounds the work on very common band values
+MAX_PATTERNS = 5
+MAX_RESPONSES = 5
+# For the report: MiniLM vectors are 384 float32 values per entry
+EMBEDDING_DIM = 384
+LATENCY_QUERIES = 200
+_PRIME = (1 << 31) - 1
+
+
+def _shingles(tokens, size=SHINGLE_SIZE):
+    if len(tokens) <= size:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))}
+    return {zlib.crc32(" ".join(tokens[i:i + size]).encode("utf-8")) for i in range(len(tokens) - size + 1)}
+
+
+class MinHasher:
+    """Universal hashes h(x) = (a*x + b) mod p; all values stay below 2**62."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, shingles):
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles)) % _PRIME
+        return ((self.a[:, None] * x[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j: return False
+        # Keep the earlier entry as the root so it stays the merged entry's base
+        if j < i: i, j = j, i
+        self.parent[j] = i
+        return True
+
+
+def _patterns(entry):
+    pats = entry.get("patterns", [])
+    return [pats] if isinstance(pats, str) else pats
+
+
+def find_duplicates(entries, threshold=NEAR_THRESHOLD):
+    """Group entries with identical or near-identical patterns.
+
+    Returns (groups of entry indices, exact merges, near merges).
+    """
+    uf = _UnionFind(len(entries))
+    exact = near = 0
+    first_seen = {}
+    shingle_sets = {}
+    for i, entry in enumerate(entries):
+        tokens = tokenize(" ".join(_patterns(entry)))
+        key = " ".join(tokens)
+        if key in first_seen:
+            exact += uf.union(first_seen[key], i)
+            continue
+        first_seen[key] = i
+        if len(tokens) >= MIN_NEAR_WORDS:
+            shingle_sets[i] = _shingles(tokens)
+
+    hasher = MinHasher()
+    rows = NUM_PERM // BANDS
+    buckets = {}
+    for i, shingles in shingle_sets.items():
+        signature = hasher.signature(shingles)
+        for band in range(BANDS):
+            bucket = buckets.setdefault((band, signature[band * rows:(band + 1) * rows].tobytes()), [])
+            for j in bucket[:MAX_BUCKET_COMPARE]:
+                if uf.find(i) == uf.find(j): continue
+                other = shingle_sets[j]
+                if len(shingles & other) / len(shingles | other) >= threshold:
+                    near += uf.union(i, j)
+            bucket.append(i)
+
+    groups = {}
+    for i in range(len(entries)):
+        groups.setdefault(uf.find(i), []).append(i)
+    return list(groups.values()), exact, near
+
+
+def merge_group(group):
+    """One entry with the first entry's fields and every distinct pattern and response."""
+    first = group[0]
+    merged = {k: v for k, v in first.items()
+              if k not in ("id", "patterns", "response", "responses", "merged_ids",
+                           "clean_response", "clean_responses", "sanitizer_version")}
+    patterns, responses, ids = [], [], []
+    seen_patterns, seen_responses = set(), set()
+    for entry in group:
+        for pattern in _patterns(entry):
+            key = " ".join(tokenize(pattern))
+            if key not in seen_patterns and len(patterns) < MAX_PATTERNS:
+                seen_patterns.add(key)
+                patterns.append(pattern)
+        for response in entry.get("responses") or [entry.get("response", "")]:
+            key = " ".join(tokenize(response))
+            if key not in seen_responses and len(responses) < MAX_RESPONSES:
+                seen_responses.add(key)
+                responses.append(response)
+        ids.append(entry.get("id") or entry_id(entry.get("patterns", []), entry.get("response", "")))
+        ids.extend(entry.get("merged_ids", ()))
+
+    merged["id"] = ids[0]
+    merged["patterns"] = patterns
+    merged["response"] = responses[0]
+    if len(responses) > 1:
+        merged["responses"] = responses
+    merged["merged_ids"] = ids[1:]
+    return merged
+
+
+def compact(entries, threshold=NEAR_THRESHOLD):
+    groups, exact, near = find_duplicates(entries, threshold)
+    merged = [entries[g[0]] if len(g) == 1 else merge_group([entries[i] for i in g]) for g in groups]
+    return merged, {"exact_merges": exact, "near_merges": near}
+
+
+def search_latency_ms(n, rng, dim=EMBEDDING_DIM, queries=LATENCY_QUERIES):
+    """Exact-search latency over `n` entries; the scan cost depends only on the size."""
+    if n == 0: return 0.0
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    index = ExactIndex(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    probes = rng.standard_normal((queries, dim), dtype=np.float32)
+    start = time.perf_counter()
+    for q in probes:
+        index.search(q, k=1)
+    return (time.perf_counter() - start) * 1000 / queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge duplicate and near-duplicate knowledge base entries.")
+    parser.add_argument("source", nargs="?", default=DB_FILE)
+    parser.add_argument("--output", help="defaults to <source>.compact.jsonl")
+    parser.add_argument("--replace", action="store_true", help="replace the source (a .bak copy is kept)")
+    parser.add_argument("--threshold", type=float, default=NEAR_THRESHOLD)
+    args = parser.parse_args()
+    output = args.output or os.path.splitext(args.source)[0] + ".compact.jsonl"
+    if args.replace and not args.source.endswith(".jsonl"):
+        parser.error("--replace needs a .jsonl source; legacy .json databases are migrated on the next import")
+
+    print(f"🔍 Scanning {args.source} for duplicates...")
+    start = time.perf_counter()
+    entries = list(iter_entries(args.source))
+    merged, stats = compact(entries, args.threshold)
+    elapsed = time.perf_counter() - start
+
+    if os.path.exists(output):
+        os.remove(output)
+    KnowledgeStore(output).append(merged)
+    if args.replace:
+        shutil.copyfile(args.source, args.source + ".bak")
+        os.replace(output, args.source)
+        output = args.source
+
+    before, after = len(entries), len(merged)
+    multi = sum(1 for e in merged if "responses" in e)
+    rng = np.random.default_rng(0)
+    latency_before, latency_after = search_latency_ms(before, rng), search_latency_ms(after, rng)
+    shrink = 1 - after / before if before else 0.0
+    print(f"✅ {before} -> {after} entries ({shrink:.1%} smaller) in {elapsed:.1f}s, written to {output}")
+    print(f"   {stats['exact_merges']} exact and {stats['near_merges']} near-duplicate merges; "
+          f"{multi} entries now hold several responses")
+    print(f"   Embedding matrix: {before * EMBEDDING_DIM * 4 / 2**20:.1f} MB -> "
+          f"{after * EMBEDDING_DIM * 4 / 2**20:.1f} MB")
+    print(f"   Exact search: {latency_before:.3f} -> {latency_after:.3f} ms/query")
+    print("💡 Re-run `python kb_format.py` if you use the binary knowledge base.")
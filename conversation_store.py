@@ -0,0 +1,144 @@
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+# Messages kept in memory (and rendered) per session; older ones are paged out
+LIVE_WINDOW = 20
+# Paged-out messages go to one JSONL file per session. They contain what the
+# user wrote, so set ARCHIVE_DIR = None to drop them instead of writing them.
+# The folder is private to the user running the bot (0700, files 0600).
+ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), "therapy_bot_sessions")
+ARCHIVE_TTL_S = 24 * 3600
+# Expired archives are looked for when a session starts, at most this often
+PRUNE_INTERVAL_S = 600
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def private_dir(path):
+    """Create `path` for this user only; refuse a folder (or link) someone else controls."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    # Shared temp folders: another user may have created it first
+    if hasattr(os, "getuid"):
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"{path} is owned by another user; choose another ARCHIVE_DIR")
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return path
+
+
+def prune_archives(archive_dir=ARCHIVE_DIR, max_age=ARCHIVE_TTL_S):
+    """Delete session archives not written to for `max_age` seconds."""
+    if not archive_dir or not os.path.isdir(archive_dir): return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(archive_dir):
+        path = os.path.join(archive_dir, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass  # removed by its own session meanwhile
+    return removed
+
+
+def maybe_prune_archives(archive_dir=ARCHIVE_DIR, interval=PRUNE_INTERVAL_S):
+    """prune_archives(), at most once per `interval` seconds per process."""
+    global _last_prune
+    with _prune_lock:
+        if time.monotonic() - _last_prune < interval and _last_prune: return 0
+        _last_prune = time.monotonic()
+    return prune_archives(archive_dir)
+
+
+class ConversationStore:
+    """One session's messages: the last `window` in memory, the rest on disk.
+
+    Older messages are appended to the session's archive file as they fall
+    out of the window and read back a page at a time with `archived_page()`.
+    The file is deleted with the store (session end) or by `clear()`;
+    files left behind by a crash expire after ARCHIVE_TTL_S.
+    """
+
+    def __init__(self, greeting=None, window=LIVE_WINDOW, archive_dir=ARCHIVE_DIR):
+        # The previous reply (needed for the search context) must stay live
+        self.window = max(window, 2)
+        self.live = deque()
+        self.archived = 0
+        self.archive_path = None
+        self._offsets = []
+        if archive_dir:
+            private_dir(archive_dir)
+            maybe_prune_archives(archive_dir)
+            self.archive_path = os.path.join(archive_dir, f"{uuid.uuid4().hex}.jsonl")
+        if greeting:
+            self.append("assistant", greeting)
+
+    def __len__(self):
+        return self.archived + len(self.live)
+
+    def append(self, role, content, meta=None):
+        message = {"role": role, "content": content}
+        if meta is not None:
+            message["meta"] = meta
+        self.live.append(message)
+        if len(self.live) > self.window:
+            self._page_out(len(self.live) - self.window)
+
+    def _page_out(self, count):
+        old = [self.live.popleft() for _ in range(count)]
+        if self.archive_path:
+            flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0)
+            with os.fdopen(os.open(self.archive_path, flags, 0o600), 'ab') as f:
+                for message in old:
+                    self._offsets.append(f.tell())
+                    f.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.archived += count
+
+    def archived_page(self, start, stop):
+        """Paged-out messages [start, stop) read back from disk (empty if dropped)."""
+        if not self.archive_path or not self._offsets: return []
+        start, stop = max(start, 0), min(stop, len(self._offsets))
+        if start >= stop: return []
+        try:
+            with open(self.archive_path, 'rb') as f:
+                f.seek(self._offsets[start])
+                return [json.loads(f.readline()) for _ in range(start, stop)]
+        except FileNotFoundError:
+            return []  # expired after ARCHIVE_TTL_S without new messages
+
+    def previous_reply(self):
+        """The bot answer before the latest user message; None right after the greeting."""
+        if len(self) > 2 and self.live[-1]["role"] == "user":
+            return self.live[-2]["content"]
+        return None
+
+    def clear(self):
+        self.live.clear()
+        self.archived = 0
+        self._offsets = []
+        self._remove_archive()
+
+    def _remove_archive(self):
+        if self.archive_path:
+            try:
+                os.remove(self.archive_path)
+            except FileNotFoundError:
+                pass
+
+    def __del__(self):
+        # Streamlit drops the session state when the session ends
+        try:
+            self._remove_archive()
+        except Exception:
+            pass
@@ -0,0 +1,163 @@
+import functools
+import threading
+import time
+from collections import deque
+
+from tracing import percentile
+
+# Decoding settings by length of the retrieved advice in generator tokens:
+# (tier, advice tokens up to, max_length, min_length, repetition_penalty).
+# A one-line tip from build_database.py does not need room for 350 tokens,
+# and a high repetition penalty on a short answer pushes the model towards
+# odd word choices, so both grow with the advice.
+LENGTH_TIERS = (
+    ("short", 40, 120, 24, 1.8),
+    ("medium", 160, 220, 40, 2.2),
+    ("long", None, 350, 50, 2.5),
+)
+# Past the latency budget decoding stops at the next sentence end; past
+# HARD_STOP_FACTOR x budget it stops wherever it is
+HARD_STOP_FACTOR = 1.5
+# Lower bound for max_length when the observed speed caps it
+MIN_BUDGET_TOKENS = 24
+SENTENCE_END = (".", "!", "?")
+
+
+class DecodingPlan:
+    """generate() settings for one reply; `budget_ms` None means no early stop."""
+    __slots__ = ("tier", "kwargs", "budget_ms")
+
+    def __init__(self, tier, kwargs, budget_ms):
+        self.tier = tier
+        self.kwargs = kwargs
+        self.budget_ms = budget_ms
+
+
+def sentence_end_ids(tokenizer):
+    """Vocabulary ids whose token text ends a sentence ("." , "▁?", '!"' ...)."""
+    return {i for token, i in tokenizer.get_vocab().items()
+            if token.rstrip("\"')").endswith(SENTENCE_END)}
+
+
+@functools.lru_cache(maxsize=None)
+def _budget_criteria_class():
+    """Defined on first use to defer importing transformers."""
+    import torch
+    from transformers import StoppingCriteria
+
+    class _BudgetCriteria(StoppingCriteria):
+        """Ends generate() at a sentence boundary once the time budget is spent.
+
+        Every sequence in the batch must be at a sentence end or finished
+        (eos / padding); `stopped` says why decoding ended early, if it did.
+        """
+        def __init__(self, budget_ms, min_length, done_ids):
+            self.started = time.perf_counter()
+            self.budget_ms = budget_ms
+            self.min_length = min_length
+            self.done_ids = torch.tensor(sorted(done_ids), dtype=torch.long)
+            self.stopped = None
+
+        def __call__(self, input_ids, scores, **kwargs):
+            elapsed = (time.perf_counter() - self.started) * 1000
+            if elapsed < self.budget_ms:
+                return False
+            if elapsed >= self.budget_ms * HARD_STOP_FACTOR:
+                self.stopped = "hard"
+                return True
+            if input_ids.shape[1] <= self.min_length or not len(self.done_ids):
+                return False
+            if bool(torch.isin(input_ids[:, -1], self.done_ids).all()):
+                self.stopped = "sentence"
+                return True
+            return False
+
+    return _BudgetCriteria
+
+
+class DecodingPolicy:
+    """Picks generate() settings per reply and keeps latency and pass-rate stats per tier.
+
+    With `adaptive=False` every reply uses `base_kwargs` unchanged (tier
+    "fixed"), the baseline to compare the tiers against.
+    """
+
+    def __init__(self, tokenizer, base_kwargs, budget_ms=None, adaptive=True, tokenizer_lock=None, history=500):
+        self.tokenizer = tokenizer
+        self.tokenizer_lock = tokenizer_lock or threading.Lock()
+        self.budget_ms = budget_ms
+        self.adaptive = adaptive
+        self.base = DecodingPlan("fixed", dict(base_kwargs), None)
+        self.history = history
+        special = {tokenizer.eos_token_id, tokenizer.pad_token_id} - {None}
+        self._done_ids = sentence_end_ids(tokenizer) | special
+        self._ms_per_step = None
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._outcomes = {}
+
+    def plan(self, advice):
+        if not self.adaptive:
+            return self.base
+        with self.tokenizer_lock:
+            n_tokens = len(self.tokenizer(advice).input_ids) if advice else 0
+        for tier, up_to, max_length, min_length, penalty in LENGTH_TIERS:
+            if up_to is None or n_tokens <= up_to:
+                break
+        with self._lock:
+            ms_per_step = self._ms_per_step
+        if self.budget_ms and ms_per_step:
+            # Do not plan more steps than the hard stop would allow at the observed speed
+            affordable = int(self.budget_ms * HARD_STOP_FACTOR / ms_per_step)
+            max_length = max(min(max_length, affordable), MIN_BUDGET_TOKENS)
+            min_length = min(min_length, max_length)
+        kwargs = dict(self.base.kwargs, max_length=max_length, min_length=min_length, repetition_penalty=penalty)
+        return DecodingPlan(tier, kwargs, self.budget_ms)
+
+    @staticmethod
+    def merge(plans):
+        """One plan for a batch: the longest tier's settings, the smallest min_length."""
+        if len(plans) == 1: return plans[0]
+        longest = max(plans, key=lambda p: p.kwargs["max_length"])
+        kwargs = dict(longest.kwargs, min_length=min(p.kwargs["min_length"] for p in plans))
+        budgets = [p.budget_ms for p in plans if p.budget_ms]
+        return DecodingPlan(longest.tier, kwargs, min(budgets) if budgets else None)
+
+    def stopping_criteria(self, plan):
+        """Fresh criteria for one generate() call (the budget clock starts now), or None."""
+        if not plan.budget_ms: return None
+        return _budget_criteria_class()(plan.budget_ms, plan.kwargs["min_length"], self._done_ids)
+
+    def record_call(self, tiers, ms, steps, stopped=None):
+        """Latency of one generate() call serving replies of the given tiers."""
+        with self._lock:
+            if steps > 0:
+                rate = ms / steps
+                self._ms_per_step = rate if self._ms_per_step is None else 0.8 * self._ms_per_step + 0.2 * rate
+            for tier in tiers:
+                self._calls.setdefault(tier, deque(maxlen=self.history)).append((ms, steps, stopped))
+
+    def record_outcome(self, plan, passed):
+        """Whether a candidate decoded under `plan` passed the quality check."""
+        with self._lock:
+            self._outcomes.setdefault(plan.tier, deque(maxlen=self.history)).append(passed)
+
+    def stats(self):
+        """Per tier: generate() latency, steps, early-stop rate and candidate pass rate."""
+        with self._lock:
+            calls = {tier: list(c) for tier, c in self._calls.items()}
+            outcomes = {tier: list(o) for tier, o in self._outcomes.items()}
+        stats = {}
+        for tier in sorted(set(calls) | set(outcomes)):
+            c, o = calls.get(tier, []), outcomes.get(tier, [])
+            latencies = [ms for ms, _, _ in c]
+            stats[tier] = {
+                "calls": len(c),
+                "latency_ms_p50": percentile(latencies, 50),
+                "latency_ms_p95": percentile(latencies, 95),
+                "avg_steps": sum(s for _, s, _ in c) / len(c) if c else 0.0,
+                "early_stop_rate": sum(1 for _, _, how in c if how) / len(c) if c else 0.0,
+                "candidates": len(o),
+                "pass_rate": sum(o) / len(o) if o else None,
+            }
+        return stats
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+
+def entry_key(text, model_name):
+    """Content address of one corpus entry for a given retriever model."""
+    return hashlib.sha1(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Corpus embedding matrix saved next to the DB and reused across sessions.
+
+    Rows are keyed by a hash of the entry's joined patterns plus the model
+    name, so only new or edited entries are sent to the encoder. Each model
+    (and quantized variant) has its own files, so switching keeps both.
+    """
+
+    def __init__(self, db_file, model_name):
+        base = os.path.splitext(db_file)[0]
+        model_slug = re.sub(r"[^\w.-]+", "_", model_name)
+        self.matrix_file = f"{base}.{model_slug}.emb.npy"
+        self.keys_file = f"{base}.{model_slug}.emb.json"
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        try:
+            with open(self.keys_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model_name:
+                return [], None
+            matrix = np.load(self.matrix_file, mmap_mode='r')
+        except (OSError, ValueError):
+            return [], None
+        if matrix.shape[0] != len(meta.get("keys", [])):
+            return [], None
+        return meta["keys"], matrix
+
+    def _save(self, keys, matrix):
+        tmp_matrix = self.matrix_file + ".tmp"
+        with open(tmp_matrix, 'wb') as f:
+            np.save(f, matrix)
+        os.replace(tmp_matrix, self.matrix_file)
+        tmp_keys = self.keys_file + ".tmp"
+        with open(tmp_keys, 'w', encoding='utf-8') as f:
+            json.dump({"model": self.model_name, "keys": keys}, f)
+        os.replace(tmp_keys, self.keys_file)
+
+    def encode(self, texts, encode_fn):
+        """Return a float32 matrix for `texts`, encoding only cache misses.
+
+        `encode_fn` takes a list of strings and returns an array of vectors.
+        """
+        keys = [entry_key(t, self.model_name) for t in texts]
+        cached_keys, cached = self._load()
+
+        # Nothing changed: serve the memory-mapped file as-is
+        if cached is not None and cached_keys == keys:
+            self.hits, self.misses = len(keys), 0
+            return cached
+
+        row_of = {k: i for i, k in enumerate(cached_keys)}
+        hit_pos = [i for i, k in enumerate(keys) if k in row_of]
+        miss_pos = [i for i, k in enumerate(keys) if k not in row_of]
+        self.hits, self.misses = len(hit_pos), len(miss_pos)
+        if not keys:
+            return None
+
+        fresh = None
+        if miss_pos:
+            fresh = np.asarray(encode_fn([texts[i] for i in miss_pos]), dtype=np.float32)
+        dim = cached.shape[1] if cached is not None else fresh.shape[1]
+
+        matrix = np.empty((len(keys), dim), dtype=np.float32)
+        if hit_pos:
+            matrix[hit_pos] = cached[[row_of[keys[i]] for i in hit_pos]]
+        if miss_pos:
+            matrix[miss_pos] = fresh
+
+        # Release the old mapping before replacing the file underneath it
+        del cached
+        self._save(keys, matrix)
+        return matrix
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
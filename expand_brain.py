@@ -1,84 +1,49 @@
-import json
-import re
-from datasets import load_dataset
-from tqdm import tqdm
+import subprocess
+import sys
+from ingest import DB_FILE, KnowledgeStore, hf_chunks, ingest_chunks
 
 # --- CONFIGURATION ---
-OUTPUT_FILE = "mindfulness_db.json"
+OUTPUT_FILE = DB_FILE
 MAX_SAMPLES_PER_SOURCE = 1000  # Limit to keep your laptop fast
 
-# Function to clean text (removes HTML tags, weird spaces)
-def clean_text(text):
-    if not isinstance(text, str): return ""
-    text = re.sub(r'<[^>]+>', '', text) # Remove HTML tags
-    text = re.sub(r'http\S+', '', text) # Remove URLs
-    text = text.replace("\n", " ").replace("\r", "")
-    return text.strip()
+# Vectorized text cleaning (removes HTML tags, weird spaces) on a pandas Series
+def clean_text(series):
+    return (series
+            .str.replace(r'<[^>]+>', '', regex=True)  # Remove HTML tags
+            .str.replace(r'http\S+', '', regex=True)   # Remove URLs
+            .str.replace("\n", " ", regex=False)
+            .str.replace("\r", "", regex=False))
 
-combined_data = []
+store = KnowledgeStore(OUTPUT_FILE)
 
 print("🧠 Starting Knowledge Base Expansion...")
 
 # --- SOURCE 1: Counsel Chat (Expert Advice) ---
 try:
-    print("⬇️ Downloading: Counsel Chat (Expert Therapist Answers)...")
-    ds = load_dataset("nbertagnolli/counsel-chat", split="train")
-    
-    count = 0
-    for row in tqdm(ds):
-        q = clean_text(row.get('questionText', ''))
-        a = clean_text(row.get('answerText', ''))
-        
-        if len(q) > 10 and len(a) > 10:
-            combined_data.append({
-                "patterns": [q],
-                "response": a,
-                "source": "CounselChat"
-            })
-            count += 1
-            if count >= MAX_SAMPLES_PER_SOURCE: break
-            
-    print(f"   ✅ Added {count} expert responses.")
+    print("⬇️ Streaming: Counsel Chat (Expert Therapist Answers)...")
+    count, added = ingest_chunks(
+        store, hf_chunks("nbertagnolli/counsel-chat"), "questionText", "answerText",
+        {"source": "CounselChat"}, min_question=10, min_answer=10,
+        limit=MAX_SAMPLES_PER_SOURCE, clean=clean_text
+    )
+    print(f"   ✅ Added {added} expert responses ({count - added} already present).")
 except Exception as e:
     print(f"   ❌ Failed to load Counsel Chat: {e}")
 
 # --- SOURCE 2: Mental Health Conversational Data (General) ---
-try:
-    print("⬇️ Downloading: General Mental Health Intents...")
-    ds = load_dataset("alexandreteles/mental-health-conversational-data", split="train")
-    
-    count = 0
-    for row in tqdm(ds):
-        text = row.get('text', '')
-        # This dataset usually has just text, we assume it's context-response format 
-        # But looking at structure, usually it's better to map 'text' as user input
-        # NOTE: This dataset structure varies, we'll try a generic mapping if available
-        # or skip if structure is complex. Let's use a known clean subset if possible.
-        # Fallback to Amod's dataset if this fails or is complex text only.
-        pass 
-except Exception as e:
-    print("   ⚠️ Skipped secondary source (Structure mismatch).")
+# This dataset only has free text, no clear context/response columns.
+# Skipped until there is a reliable mapping; Amod's dataset covers it below.
+print("   ⚠️ Skipped secondary source (Structure mismatch).")
 
 # --- SOURCE 3: Amod's Dataset (The one you already used) ---
 try:
-    print("⬇️ Downloading: Amod's Mental Health Conversations...")
-    ds = load_dataset("Amod/mental_health_counseling_conversations", split="train")
-    
-    count = 0
-    for row in tqdm(ds):
-        q = clean_text(row.get('Context', ''))
-        a = clean_text(row.get('Response', ''))
-        
-        if len(q) > 5 and len(a) > 5:
-            combined_data.append({
-                "patterns": [q],
-                "response": a,
-                "source": "AmodDataset"
-            })
-            count += 1
-            if count >= MAX_SAMPLES_PER_SOURCE: break
-            
-    print(f"   ✅ Added {count} conversation pairs.")
+    print("⬇️ Streaming: Amod's Mental Health Conversations...")
+    count, added = ingest_chunks(
+        store, hf_chunks("Amod/mental_health_counseling_conversations"), "Context", "Response",
+        {"source": "AmodDataset"}, min_question=5, min_answer=5,
+        limit=MAX_SAMPLES_PER_SOURCE, clean=clean_text
+    )
+    print(f"   ✅ Added {added} conversation pairs ({count - added} already present).")
 except Exception as e:
     print(f"   ❌ Failed to load Amod dataset: {e}")
 
@@ -96,11 +61,15 @@ hardcoded = [
         "source": "Hardcoded"
     }
 ]
-combined_data.extend(hardcoded)
+# Responses are sanitized and deduplicated as they are appended
+store.append(hardcoded)
+
+print(f"💾 {OUTPUT_FILE} now has {len(store)} total entries.")
 
-# --- SAVE TO FILE ---
-print(f"💾 Saving {len(combined_data)} total entries to {OUTPUT_FILE}...")
-with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-    json.dump(combined_data, f, indent=2, ensure_ascii=False)
+# --- OFFLINE INDEX BUILD ---
+# Encode the corpus now, on every core, so the bot only loads the result.
+# A separate process, since the worker pool re-imports the main module.
+if subprocess.run([sys.executable, "-m", "build_index", "--db", OUTPUT_FILE]).returncode != 0:
+    print("   ❌ Index build failed (the bot will encode at startup instead).")
 
 print("🚀 Success! Your brain is now larger. Restart therapy_bot.py to use it.")
\ No newline at end of file
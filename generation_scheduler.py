@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from tracing import percentile
+
+
+class _Request:
+    __slots__ = ("prompt", "future", "enqueued")
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class BatchScheduler:
+    """Micro-batching queue in front of the generator.
+
+    Prompts that arrive within `max_wait` seconds of the first queued one are
+    handed to `run_batch` together (up to `max_batch_size`), and each caller
+    gets its own result back through a Future.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait=0.02, history=1000):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._batch_sizes = deque(maxlen=history)
+        self._waits = deque(maxlen=history)
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self._worker = threading.Thread(target=self._loop, name="generation-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt):
+        request = _Request(prompt)
+        self._queue.put(request)
+        return request.future
+
+    def generate(self, prompt, timeout=None):
+        return self.submit(prompt).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Past the deadline we still take whatever is already queued
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.batches += 1
+                self._batch_sizes.append(len(batch))
+                self._waits.extend(started - r.enqueued for r in batch)
+            try:
+                results = self.run_batch([r.prompt for r in batch])
+            except Exception as e:
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            for r, result in zip(batch, results):
+                r.future.set_result(result)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._stats_lock:
+            sizes = list(self._batch_sizes)
+            waits = [w * 1000 for w in self._waits]
+        return {
+            "queue_depth": self.queue_depth(),
+            "batches": self.batches,
+            "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "max_batch_size": max(sizes, default=0),
+            "wait_ms_p50": percentile(waits, 50),
+            "wait_ms_p95": percentile(waits, 95),
+        }
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import re
+
+from sanitizer import SANITIZER_VERSION, is_sanitized, sanitize_entries
+
+DB_FILE = "mindfulness_db.jsonl"
+CHUNK_SIZE = 1000
+
+_SPACES = re.compile(r'\s+')
+
+
+def _normalize(text):
+    return _SPACES.sub(' ', str(text)).strip().casefold()
+
+
+def entry_id(patterns, response):
+    """Content hash of an entry; identical Q&A pairs from any source share it."""
+    if isinstance(patterns, str): patterns = [patterns]
+    key = "\x1f".join(_normalize(p) for p in patterns) + "\x00" + _normalize(response)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:32]
+
+
+def iter_entries(path):
+    """Stream entries from a JSON Lines store or a legacy JSON array."""
+    if path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def _legacy_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def load_entries(path=DB_FILE):
+    """All entries of the knowledge base, falling back to the legacy JSON file."""
+    if not os.path.exists(path) and os.path.exists(_legacy_path(path)):
+        path = _legacy_path(path)
+    return list(iter_entries(path))
+
+
+class KnowledgeStore:
+    """Append-only JSON Lines knowledge base with a content-hash dedup index.
+
+    Only the ids of stored entries are held in memory; new records are
+    sanitized and appended, records already present are skipped. Entries
+    cleaned by an older SANITIZER_VERSION are re-sanitized when the store
+    is opened, so the bot never has to clean them at runtime.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.ids = set()
+        self.count = 0
+        if os.path.exists(path):
+            stale = 0
+            for entry in iter_entries(path):
+                self.count += 1
+                self.ids.add(entry.get("id") or entry_id(entry.get("patterns", []), entry.get("response", "")))
+                # Entries folded into this one by compact_db.py must not be re-imported
+                self.ids.update(entry.get("merged_ids", ()))
+                stale += not is_sanitized(entry)
+            if stale and path.endswith(".jsonl"):
+                self.resanitize(stale)
+        elif path.endswith(".jsonl") and os.path.exists(_legacy_path(path)):
+            # One-time migration so earlier JSON databases are kept
+            print(f"📦 Migrating {_legacy_path(path)} -> {path}...")
+            self.append(iter_entries(_legacy_path(path)))
+
+    def __len__(self):
+        return self.count
+
+    def resanitize(self, stale=None):
+        """Rewrite the store with every stale entry re-cleaned, CHUNK_SIZE entries at a time."""
+        print(f"🧼 Re-sanitizing {stale if stale is not None else 'stale'} entries "
+              f"(sanitizer v{SANITIZER_VERSION}) in {self.path}...")
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as out:
+            chunk = []
+            for entry in iter_entries(self.path):
+                chunk.append(entry)
+                if len(chunk) >= CHUNK_SIZE:
+                    self._write_sanitized(out, chunk)
+                    chunk = []
+            self._write_sanitized(out, chunk)
+        # Swapped in whole, so an interrupted run leaves the old store intact
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _write_sanitized(out, entries):
+        for entry in sanitize_entries(entries):
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def append(self, entries):
+        """Append entries not already stored; returns how many were written."""
+        fresh = []
+        for entry in entries:
+            eid = entry.get("id") or entry_id(entry.get("patterns", []), entry.get("response", ""))
+            if eid in self.ids: continue
+            self.ids.add(eid)
+            entry["id"] = eid
+            fresh.append(entry)
+        if not fresh: return 0
+        sanitize_entries(fresh)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in fresh:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.count += len(fresh)
+        return len(fresh)
+
+
+def ingest_chunks(store, chunks, q_col, a_col, tags, min_question=0, min_answer=0, limit=None, clean=None):
+    """Append question/answer rows from DataFrame chunks to the store.
+
+    `clean` is an optional vectorized cleaner applied to each text column
+    (a pandas Series -> Series). `limit` caps the number of valid rows read,
+    counting ones that were already stored, so re-runs cover the same rows.
+    Returns (rows accepted, entries added).
+    """
+    accepted = added = 0
+    for df in chunks:
+        questions = df[q_col].fillna("").astype(str)
+        answers = df[a_col].fillna("").astype(str)
+        if clean is not None:
+            questions, answers = clean(questions), clean(answers)
+        questions, answers = questions.str.strip(), answers.str.strip()
+
+        keep = (questions.str.len() > min_question) & (answers.str.len() > min_answer)
+        questions, answers = questions[keep], answers[keep]
+        if limit is not None:
+            questions, answers = questions[:limit - accepted], answers[:limit - accepted]
+
+        accepted += len(questions)
+        added += store.append({"patterns": [q], "response": a, **tags} for q, a in zip(questions, answers))
+        if limit is not None and accepted >= limit: break
+    return accepted, added
+
+
+def hf_chunks(name, split="train", chunk_size=CHUNK_SIZE):
+    """Stream a Hugging Face dataset as DataFrame chunks without materializing it."""
+    import pandas as pd
+    from datasets import load_dataset
+    ds = load_dataset(name, split=split, streaming=True)
+    for batch in ds.iter(batch_size=chunk_size):
+        yield pd.DataFrame(batch)
+
+
+def csv_chunks(path, chunk_size=CHUNK_SIZE):
+    import pandas as pd
+    yield from pd.read_csv(path, chunksize=chunk_size)
@@ -0,0 +1,190 @@
+import json
+import mmap
+import os
+import shutil
+
+import numpy as np
+
+from ingest import DB_FILE, iter_entries, load_entries
+from sanitizer import SANITIZER_VERSION, is_sanitized
+
+KB_FILE = "mindfulness_db.kb"
+KB_FORMAT_VERSION = 1
+TEXT_COLUMNS = ("patterns", "response", "clean_response", "extra")
+
+
+def pattern_text(entry):
+    """The text an entry is embedded and searched by: its patterns joined."""
+    pat_list = entry.get('patterns', [])
+    if isinstance(pat_list, str): pat_list = [pat_list]
+    return " ".join(pat_list)
+
+
+class TextColumn:
+    """Offset-indexed UTF-8 strings, decoded from a memory map only when read."""
+
+    def __init__(self, base):
+        self.offsets = np.load(base + ".off.npy", mmap_mode='r')
+        self._file = open(base + ".bin", 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap refuses empty files; an all-empty column has nothing to map
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self._data[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def write_kb(entries, path=KB_FILE):
+    """Write entries column by column; only the offsets are held in memory.
+
+    The KB is built in `<path>.tmp` and swapped in when complete, so a
+    failed run never leaves half-written columns next to a valid meta.json
+    and a running bot keeps its memory-mapped files.
+    """
+    target, path = path, path + ".tmp"
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    files = {c: open(os.path.join(path, c + ".bin"), 'wb') for c in TEXT_COLUMNS}
+    offsets = {c: [0] for c in TEXT_COLUMNS}
+    versions = []
+    try:
+        for entry in entries:
+            extra = {k: v for k, v in entry.items()
+                     if k not in ("patterns", "response", "clean_response", "sanitizer_version")}
+            values = {
+                "patterns": pattern_text(entry),
+                "response": entry.get("response", ""),
+                "clean_response": entry.get("clean_response", ""),
+                "extra": json.dumps(extra, ensure_ascii=False),
+            }
+            for column, value in values.items():
+                data = value.encode("utf-8")
+                files[column].write(data)
+                offsets[column].append(offsets[column][-1] + len(data))
+            versions.append(SANITIZER_VERSION if is_sanitized(entry) else 0)
+    finally:
+        for f in files.values():
+            f.close()
+
+    for column in TEXT_COLUMNS:
+        np.save(os.path.join(path, column + ".off.npy"), np.array(offsets[column], dtype=np.uint64))
+    np.save(os.path.join(path, "sanitizer_version.npy"), np.array(versions, dtype=np.int32))
+    with open(os.path.join(path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({"format": KB_FORMAT_VERSION, "count": len(versions)}, f)
+
+    # Move the old KB aside rather than deleting it in place: open maps stay valid
+    old = target + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, old)
+    os.replace(path, target)
+    shutil.rmtree(old, ignore_errors=True)
+    return len(versions)
+
+
+class JsonKnowledgeBase:
+    """Knowledge base parsed fully into memory from the JSON/JSONL store."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def pattern_texts(self):
+        return [pattern_text(e) for e in self.entries]
+
+    def response(self, i):
+        return self.entries[i].get('response', "")
+
+    def clean_response(self, i):
+        """Precomputed sanitized response, or None if missing or stale."""
+        entry = self.entries[i]
+        return entry["clean_response"] if is_sanitized(entry) else None
+
+    def responses(self, i):
+        """All candidate responses; several for entries merged by compact_db.py."""
+        entry = self.entries[i]
+        return entry.get('responses') or [entry.get('response', "")]
+
+    def clean_responses(self, i):
+        entry = self.entries[i]
+        if not is_sanitized(entry): return None
+        return entry.get("clean_responses") or [entry["clean_response"]]
+
+    def extra(self, i):
+        return {k: v for k, v in self.entries[i].items() if k not in ("patterns", "response")}
+
+
+class BinaryKnowledgeBase:
+    """Memory-mapped columnar knowledge base written by write_kb().
+
+    Startup touches only the pattern column; response strings are read
+    from disk when an entry is actually retrieved.
+    """
+
+    def __init__(self, path=KB_FILE):
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("format") != KB_FORMAT_VERSION:
+            raise ValueError(f"{path} has format {meta.get('format')}, expected {KB_FORMAT_VERSION}")
+        self.path = path
+        self.columns = {c: TextColumn(os.path.join(path, c)) for c in TEXT_COLUMNS}
+        self.sanitizer_versions = np.load(os.path.join(path, "sanitizer_version.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.sanitizer_versions)
+
+    def pattern_texts(self):
+        return list(self.columns["patterns"])
+
+    def response(self, i):
+        return self.columns["response"][i]
+
+    def clean_response(self, i):
+        if self.sanitizer_versions[i] == SANITIZER_VERSION:
+            return self.columns["clean_response"][i]
+        return None
+
+    # Merged entries keep their extra responses in the `extra` column
+    def responses(self, i):
+        return self.extra(i).get("responses") or [self.response(i)]
+
+    def clean_responses(self, i):
+        if self.sanitizer_versions[i] != SANITIZER_VERSION: return None
+        return self.extra(i).get("clean_responses") or [self.columns["clean_response"][i]]
+
+    def extra(self, i):
+        return json.loads(self.columns["extra"][i])
+
+
+def open_knowledge_base(db_file=DB_FILE, kb_file=KB_FILE):
+    """Prefer the binary KB when it is at least as new as the JSON store."""
+    if os.path.exists(os.path.join(kb_file, "meta.json")):
+        kb_time = os.path.getmtime(os.path.join(kb_file, "meta.json"))
+        if not os.path.exists(db_file) or kb_time >= os.path.getmtime(db_file):
+            return BinaryKnowledgeBase(kb_file)
+    try:
+        return JsonKnowledgeBase(load_entries(db_file))
+    except Exception:
+        return JsonKnowledgeBase([])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the JSON/JSONL knowledge base to the binary format.")
+    parser.add_argument("source", nargs="?", default=DB_FILE)
+    parser.add_argument("target", nargs="?", default=KB_FILE)
+    args = parser.parse_args()
+
+    print(f"📦 Converting {args.source} -> {args.target}...")
+    count = write_kb(iter_entries(args.source), args.target)
+    print(f"✅ Wrote {count} entries.")
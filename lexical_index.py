@@ -0,0 +1,96 @@
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from safety_matcher import tokenize
+
+
+class BM25Index:
+    """Okapi BM25 over the entries' patterns, stored as an inverted index.
+
+    Each term maps to the sorted ids of the entries containing it and their
+    precomputed BM25 weights, so scoring a query is one vectorized add per
+    query term.
+    """
+
+    def __init__(self, texts, k1=1.2, b=0.75):
+        doc_ids = defaultdict(list)
+        term_freqs = defaultdict(list)
+        lengths = []
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                doc_ids[term].append(doc)
+                term_freqs[term].append(tf)
+
+        self.n_docs = len(lengths)
+        doc_len = np.array(lengths, dtype=np.float32)
+        avg_len = float(doc_len.mean()) if self.n_docs else 1.0
+        self.postings = {}
+        for term, docs in doc_ids.items():
+            ids = np.array(docs, dtype=np.int64)
+            tf = np.array(term_freqs[term], dtype=np.float32)
+            idf = self._idf(len(ids))
+            weights = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len[ids] / max(avg_len, 1e-6)))
+            self.postings[term] = (ids, weights.astype(np.float32), idf)
+        # Weight of a query term that no entry contains
+        self.unseen_idf = self._idf(0)
+
+    def __len__(self):
+        return self.n_docs
+
+    def _idf(self, df):
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def scores(self, terms):
+        """Dense BM25 scores of every entry for the query terms."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(terms):
+            if term in self.postings:
+                ids, weights, _ = self.postings[term]
+                scores[ids] += weights
+        return scores
+
+    def top(self, scores, k):
+        """Ids of the `k` best-scoring entries that match at least one term."""
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def coverage(self, terms, doc):
+        """Share of the query's idf weight carried by terms that `doc` contains."""
+        total = matched = 0.0
+        for term in set(terms):
+            if term not in self.postings:
+                total += self.unseen_idf
+                continue
+            ids, _, idf = self.postings[term]
+            total += idf
+            pos = np.searchsorted(ids, doc)
+            if pos < len(ids) and ids[pos] == doc:
+                matched += idf
+        return matched / total if total else 0.0
+
+    def confident_match(self, terms, scores, k=1, max_terms=6, min_coverage=0.8, min_margin=1.5):
+        """(ids, confidences) when a short query has a clear lexical winner, else None.
+
+        The winner must carry `min_coverage` of the query's idf weight and
+        beat the runner-up by `min_margin`; confidences are in [0, 1].
+        """
+        if not terms or len(set(terms)) > max_terms:
+            return None
+        top = self.top(scores, max(k, 2))
+        if not len(top):
+            return None
+        best = scores[top[0]]
+        if len(top) > 1 and best < min_margin * scores[top[1]]:
+            return None
+        confidence = self.coverage(terms, int(top[0]))
+        if confidence < min_coverage:
+            return None
+        top = top[:k]
+        return top, confidence * scores[top] / best
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+from tracing import percentile
+
+# Closed-loop load generator for api_server.py: each of --concurrency clients
+# keeps one keep-alive connection and sends its next request when the last
+# one is answered. Messages come from the benchmark conversations.
+CONVERSATIONS_FILE = "bench_conversations.jsonl"
+
+
+def load_messages(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [turn for line in f if line.strip() for turn in json.loads(line)["turns"]]
+
+
+def request_body(endpoint, message):
+    if endpoint == "chat": return {"message": message}
+    if endpoint == "retrieve": return {"query": message, "k": 3}
+    return {"text": message}
+
+
+async def send(reader, writer, host, path, body):
+    data = json.dumps(body).encode("utf-8")
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(data)}\r\n\r\n").encode("latin-1") + data)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        # Server closed the keep-alive connection
+        raise ConnectionResetError("connection closed before the response")
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b""): break
+        name, _, value = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, path, bodies, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for body in bodies:
+            if time.perf_counter() >= deadline: break
+            start = time.perf_counter()
+            try:
+                status = await send(reader, writer, host, path, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                statuses["conn_error"] += 1
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            statuses[status] += 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        writer.close()
+
+
+async def run(host, port, endpoint, concurrency, requests, duration, messages):
+    latencies, statuses = [], Counter()
+    per_client = -(-requests // concurrency)
+    tasks = []
+    start = time.perf_counter()
+    deadline = start + duration if duration else float("inf")
+    for c in range(concurrency):
+        # Offset each client so they do not all send the same message at once
+        bodies = [request_body(endpoint, messages[(c + i * concurrency) % len(messages)]) for i in range(per_client)]
+        tasks.append(client(host, port, f"/{endpoint}", bodies, deadline, latencies, statuses))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start, latencies, statuses
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure requests/sec and latency of api_server.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--endpoint", choices=["chat", "retrieve", "scan"], default="chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--duration", type=float, help="stop each level after this many seconds")
+    parser.add_argument("--conversations", default=CONVERSATIONS_FILE)
+    args = parser.parse_args()
+
+    messages = load_messages(args.conversations)
+    print(f"📊 /{args.endpoint} on {args.host}:{args.port}, {args.requests} requests per level")
+    print(f"   {'clients':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    for concurrency in args.concurrency:
+        wall_s, latencies, statuses = asyncio.run(
+            run(args.host, args.port, args.endpoint, concurrency, args.requests, args.duration, messages)
+        )
+        ok = statuses[200]
+        codes = ", ".join(f"{code}: {n}" for code, n in sorted(statuses.items(), key=str))
+        print(f"   {concurrency:>7} {ok / wall_s:>8.2f} {percentile(latencies, 50):>9.1f} "
+              f"{percentile(latencies, 95):>9.1f} {percentile(latencies, 99):>9.1f}  {codes}")
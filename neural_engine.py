@@ -0,0 +1,846 @@
+import contextvars
+import functools
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+# torch / transformers / sentence_transformers are imported where they are
+# first used, so importing this module (and rendering the UI) stays fast
+import numpy as np
+from embedding_cache import EmbeddingCache
+from vector_index import build_index
+from lexical_index import BM25Index
+from generation_scheduler import BatchScheduler
+from decoding_policy import DecodingPolicy
+from safety_matcher import PhraseMatcher, load_lexicon, tokenize
+from sanitizer import DataSanitizer
+from ingest import DB_FILE
+from kb_format import KB_FILE, open_knowledge_base
+from build_index import INDEX_FILE, artifact_mismatch, load_index_artifact
+from query_cache import ReplyPool, TTLCache, normalize_query
+from tracing import Tracer
+
+DATABASE_FILE = DB_FILE
+# Binary KB from `python kb_format.py`; used instead of the JSONL when up to date
+KNOWLEDGE_BASE_FILE = KB_FILE
+# Corpus embeddings from `python build_index.py`; loaded instead of encoding at
+# startup when it matches the knowledge base and retriever. With
+# REQUIRE_INDEX_ARTIFACT the bot refuses to start without a matching one.
+INDEX_ARTIFACT_FILE = INDEX_FILE
+REQUIRE_INDEX_ARTIFACT = False
+# Next to this file, so launching from another directory still finds it
+CRISIS_LEXICON_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_lexicon.txt")]
+MODEL_NAME = "google/flan-t5-base"
+RETRIEVER_NAME = "all-MiniLM-L6-v2"
+
+# CPU inference precision: "fp32", "int8" (dynamic quantization of the
+# Linear layers) or, for the generator only, "bf16". NUM_THREADS=None keeps
+# torch's default thread count.
+GENERATOR_PRECISION = "fp32"
+RETRIEVER_PRECISION = "fp32"
+NUM_THREADS = None
+
+# Similarity search backend: "exact" scans every entry, "ivf" only the
+# IVF_NPROBE nearest clusters (higher = better recall, slower)
+INDEX_BACKEND = "exact"
+IVF_NPROBE = 8
+IVF_QUANTIZE = None  # or "int8" to keep 1/4 of the vector memory
+
+# Lexical fast path: a BM25 inverted index over the patterns. Short,
+# keyword-like queries with a clear lexical winner skip the encoder.
+LEXICAL_FAST_PATH = True
+LEXICAL_MAX_TERMS = 6
+LEXICAL_MIN_COVERAGE = 0.8  # share of the query's idf weight the winner must match
+LEXICAL_MIN_MARGIN = 1.5    # winner's BM25 score vs the runner-up
+# Other queries rank the top HYBRID_CANDIDATES semantic and lexical hits by
+# (1 - HYBRID_WEIGHT) * cosine + HYBRID_WEIGHT * normalized BM25; 0 = cosine only.
+# The score returned (and checked against MIN_RETRIEVAL_SCORE) stays the cosine.
+HYBRID_WEIGHT = 0.3
+HYBRID_CANDIDATES = 20
+
+# Load the models on background threads (retriever and generator in
+# parallel). Until the generator is ready, replies are the retrieved advice.
+BACKGROUND_LOADING = True
+
+# Micro-batching: prompts from concurrent users that arrive within
+# MAX_BATCH_WAIT_MS of each other share one generate() call
+BATCH_GENERATION = True
+MAX_BATCH_SIZE = 8
+MAX_BATCH_WAIT_MS = 20
+
+# "parallel" decodes NUM_CANDIDATES samples from one encoder pass and keeps the
+# best one that passes the quality filter; "sequential" retries one at a time
+CANDIDATE_MODE = "parallel"
+NUM_CANDIDATES = 3
+
+GENERATION_KWARGS = dict(
+    max_length=350,
+    min_length=50,
+    do_sample=True,
+    temperature=0.7,
+    repetition_penalty=2.5,
+    no_repeat_ngram_size=3
+)
+# "adaptive" sizes max/min length and the repetition penalty to the retrieved
+# advice and, once LATENCY_BUDGET_MS of decoding is spent, stops at the next
+# sentence end; "fixed" always decodes with GENERATION_KWARGS
+DECODING_POLICY = "adaptive"
+LATENCY_BUDGET_MS = 4000
+
+# Caches keyed by message text. Turn both off for privacy-sensitive deployments,
+# otherwise recent messages stay in server memory until evicted or expired.
+CACHE_QUERY_EMBEDDINGS = True
+QUERY_CACHE_SIZE = 4096
+QUERY_CACHE_TTL_S = 3600
+# Reuse accepted replies for the same (message, advice) once REPLY_POOL_SIZE
+# different ones have been generated
+CACHE_REPLIES = True
+REPLY_CACHE_SIZE = 1024
+REPLY_POOL_SIZE = 4
+REPLY_CACHE_TTL_S = 3600
+
+# Below this similarity the bot asks for clarification instead of answering
+MIN_RETRIEVAL_SCORE = 0.20
+LOW_CONFIDENCE_REPLY = "I'm listening. Could you clarify that a little bit?"
+
+# Per-stage timings: one JSON line per message/startup (no message content)
+# plus rolling aggregates in Prometheus textfile format for monitoring.
+# The log rotates at TRACE_LOG_MAX_BYTES, keeping TRACE_LOG_BACKUPS old files.
+TRACE_LOG_FILE = "metrics.jsonl"
+TRACE_LOG_MAX_BYTES = 10 * 2**20
+TRACE_LOG_BACKUPS = 3
+METRICS_FILE = "metrics.prom"
+TRACER = Tracer(TRACE_LOG_FILE, METRICS_FILE, log_max_bytes=TRACE_LOG_MAX_BYTES, log_backups=TRACE_LOG_BACKUPS)
+
+# Candidates containing any of these are rejected (checked while streaming too)
+BANNED_PHRASES = ("instruction", "houston", "office")
+# Prompt headers echoed by the model; stripped before the check above
+ARTIFACT_MARKERS = ("Instructions:", "Reference Advice:")
+FALLBACK_REPLY = "I hear you. Could you tell me more about how this is affecting your daily life?"
+
+# SAFETY SYSTEM
+class SafetySystem:
+    def __init__(self, lexicon_files=CRISIS_LEXICON_FILES, tracer=TRACER):
+        self.tracer = tracer
+        # Built-in phrases stay active even if a lexicon file is missing
+        self.crisis_keywords = [
+            "suicide", "kill myself", "want to die", "end it all", "shoot myself",
+            "self-harm", "cutting", "overdose", "hurt myself", "kill", "killing"
+        ]
+        for path in lexicon_files:
+            try:
+                self.crisis_keywords.extend(load_lexicon(path))
+            except OSError as e:
+                print(f"⚠️ Crisis lexicon {path} not loaded ({e}); only the built-in phrases are active")
+        # Compiled once; scan() is a single whole-word pass over the message
+        self.matcher = PhraseMatcher(self.crisis_keywords)
+
+    def scan(self, text):
+        with self.tracer.span("safety_scan") as span:
+            span["hit"] = self.matcher.search(text) is not None
+        if span["hit"]:
+            return "🚨 **CRITICAL ALERT:** Please contact emergency services (988) immediately."
+        return None
+
+# --- STREAMING HELPERS ---
+@functools.lru_cache(maxsize=None)
+def _streaming_classes():
+    """(_AbortCriteria, _CountingStreamer); defined on first use to defer importing transformers."""
+    from transformers import StoppingCriteria, TextIteratorStreamer
+
+    class _AbortCriteria(StoppingCriteria):
+        """Stops generate() as soon as the consumer abandons the candidate."""
+        def __init__(self, abort_event):
+            self.abort_event = abort_event
+
+        def __call__(self, input_ids, scores, **kwargs):
+            return self.abort_event.is_set()
+
+    class _CountingStreamer(TextIteratorStreamer):
+        """Decodes under `tokenizer_lock`: the fast tokenizer is shared with other sessions."""
+        def __init__(self, tokenizer, tokenizer_lock, **kwargs):
+            super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True, **kwargs)
+            self.tokenizer_lock = tokenizer_lock
+            self.token_count = 0
+
+        def put(self, value):
+            # The first put() is the decoder start token, which skip_prompt drops
+            if not self.next_tokens_are_prompt:
+                self.token_count += value.numel()
+            with self.tokenizer_lock:
+                super().put(value)
+
+        def end(self):
+            # Decodes whatever is left in the token cache
+            with self.tokenizer_lock:
+                super().end()
+
+    return _AbortCriteria, _CountingStreamer
+
+
+class ReplyStream:
+    """Iterates over the growing reply text of one streamed answer.
+
+    An empty string is yielded when a candidate is abandoned, so the caller
+    can clear what it has shown. Once exhausted, `text`, `clean_advice` and
+    `stats` (time-to-first-token, tokens/sec) are filled in.
+    """
+    def __init__(self, engine, input_text, clean_advice, reply_key=None):
+        self.engine = engine
+        self.input_text = input_text
+        self.clean_advice = clean_advice
+        self.reply_key = reply_key
+        self.text = None
+        self.stats = {}
+
+    def __iter__(self):
+        if not self.engine.generator_ready.is_set():
+            self.text = self.engine._retrieval_only_reply(self.clean_advice)
+            self.stats = {"retrieval_only": True}
+            yield self.text
+            return
+        if self.reply_key is not None:
+            pooled = self.engine.reply_pool.pick(self.reply_key)
+            if pooled is not None:
+                self.text = pooled
+                self.stats = {"cached": True}
+                self.engine._mark_reply()
+                yield pooled
+                return
+
+        started = time.perf_counter()
+        usage = {"tokens": 0}
+        first_token_at = None
+        attempts = 0
+        abandoned = 0
+        tracer = self.engine.tracer
+        plan = self.engine.decoding.plan(self.clean_advice)
+        for attempt in range(2):
+            attempts += 1
+            partial = ""
+            with tracer.span("stream_attempt", attempt=attempt) as span:
+                candidate = self.engine._stream_candidate(self.input_text, usage, plan)
+                for partial in candidate:
+                    if first_token_at is None and partial:
+                        first_token_at = time.perf_counter()
+                        tracer.record("time_to_first_token", (first_token_at - started) * 1000)
+                    shown = self.engine._stream_view(partial)
+                    if self.engine._has_banned_phrase(shown):
+                        candidate.close()
+                        abandoned += 1
+                        span["abandoned"] = True
+                        tracer.event("quality_reject", reason="banned", midstream=True)
+                        self.engine.decoding.record_outcome(plan, False)
+                        partial = None
+                        yield ""
+                        break
+                    yield shown
+            if partial is not None:
+                response = self.engine._clean_artifacts(partial)
+                reason = self.engine._rejection_reason(response)
+                self.engine.decoding.record_outcome(plan, reason is None)
+                if reason is None:
+                    self.text = response
+                    if self.reply_key is not None:
+                        self.engine.reply_pool.add(self.reply_key, response)
+                    break
+                tracer.event("quality_reject", reason=reason)
+                yield ""
+
+        elapsed = time.perf_counter() - started
+        tokens = usage["tokens"]
+        if self.text is None:
+            self.text = FALLBACK_REPLY
+        self.stats = {
+            "ttft_ms": round((first_token_at - started) * 1000) if first_token_at else None,
+            "tokens": tokens,
+            "tokens_per_s": round(tokens / elapsed, 1) if elapsed > 0 else 0.0,
+            "attempts": attempts,
+            "abandoned": abandoned,
+            "tier": plan.tier,
+        }
+        self.engine.reply_stats.append(self.stats)
+        self.engine._mark_reply()
+
+def _apply_precision(model, precision):
+    """Return `model` converted for CPU inference at the given precision."""
+    import torch
+    model.eval()
+    if precision == "fp32":
+        return model
+    if precision == "int8":
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if precision == "bf16":
+        return model.to(torch.bfloat16)
+    raise ValueError(f"Unknown precision '{precision}', choose fp32, int8 or bf16")
+
+def contextual_query(previous_reply, prompt):
+    """Combine previous bot answer + current user input for better search."""
+    if previous_reply:
+        return f"{previous_reply[-60:]} {prompt}"
+    return prompt
+
+def embedding_model_key(retriever_name, precision):
+    # Quantized retrievers produce slightly different vectors; keep them apart
+    return retriever_name if precision == "fp32" else f"{retriever_name}@{precision}"
+
+def load_retriever(retriever_name, precision):
+    from sentence_transformers import SentenceTransformer
+    return _apply_precision(SentenceTransformer(retriever_name), precision)
+
+def build_search_query(messages, prompt):
+    """contextual_query for a message list that already ends with the current user message."""
+    return contextual_query(messages[-2]["content"] if len(messages) > 2 else None, prompt)
+
+# --- 3. NEURAL ENGINE ---
+class NeuralEngine:
+    """Process-wide model holder; one instance is shared by every session.
+
+    `progress` receives human-readable load messages (e.g. st.write); they
+    are also kept in `load_messages`. With `background=True` the constructor
+    returns at once: wait on `retrieval_ready` before retrieving, and until
+    `generator_ready` is set replies are the retrieved advice itself.
+    Subclasses can override _load_retriever/_load_generator to plug in
+    other models (see bench_pipeline.py).
+    """
+    model_name = MODEL_NAME
+    retriever_name = RETRIEVER_NAME
+
+    def __init__(self, progress=None, generator_precision=GENERATOR_PRECISION,
+                 retriever_precision=RETRIEVER_PRECISION, num_threads=NUM_THREADS,
+                 db_file=DATABASE_FILE, kb_file=KNOWLEDGE_BASE_FILE, tracer=TRACER,
+                 background=False, index_file=INDEX_ARTIFACT_FILE):
+        self.created = time.perf_counter()
+        self._progress = progress or (lambda msg: None)
+        self.load_messages = []
+        self.tracer = tracer
+        self.db_file = db_file
+        self.kb_file = kb_file
+        self.index_file = index_file
+        self.generator_precision = generator_precision
+        self.retriever_precision = retriever_precision
+        self.num_threads = num_threads
+        # Set when each stage is usable; a failed generator leaves retrieval-only replies
+        self.retrieval_ready = threading.Event()
+        self.generator_ready = threading.Event()
+        self.loading_done = threading.Event()
+        self.load_error = None
+        # Seconds since construction: retrieval_ready, generator_ready, first_reply
+        self.startup_times = {}
+        # Streamlit serves each session on its own thread
+        self._tokenizer_lock = threading.Lock()
+        self._retriever_lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+        self.tokenizer = None
+        self.model = None
+        self.retriever = None
+        self.index = None
+        self.embeddings = None
+        self.lexical = None
+        self.kb = None
+        self._live_clean = {}
+        self.embedding_model = embedding_model_key(self.retriever_name, retriever_precision)
+        self.embedding_cache = EmbeddingCache(db_file, self.embedding_model)
+        self.scheduler = None
+        self.decoding = None
+        self.reply_stats = deque(maxlen=500)
+        self.query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_S) if CACHE_QUERY_EMBEDDINGS else None
+        self.reply_pool = ReplyPool(REPLY_CACHE_SIZE, REPLY_POOL_SIZE, REPLY_CACHE_TTL_S) if CACHE_REPLIES else None
+        if background:
+            threading.Thread(target=self._initialize_models, name="model-load", daemon=True).start()
+        else:
+            self._initialize_models()
+            if self.load_error is not None:
+                raise self.load_error
+
+    def progress(self, msg):
+        self.load_messages.append(msg)
+        self._progress(msg)
+
+    def _initialize_models(self):
+        """Load the retrieval stage here and the generator on a second thread."""
+        try:
+            with self.tracer.trace("startup"):
+                if self.num_threads:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                with ThreadPoolExecutor(max_workers=1, thread_name_prefix="generator-load") as pool:
+                    # Each task gets its own copy of the context so its spans join this trace
+                    generator = pool.submit(contextvars.copy_context().run, self._load_generator_stage)
+                    try:
+                        self._load_retrieval_stage()
+                    finally:
+                        generator.result()
+        except Exception as e:
+            self.load_error = e
+            self.progress(f"❌ Model loading failed: {e}")
+        finally:
+            self.loading_done.set()
+
+    def _load_retrieval_stage(self):
+        self.progress("📂 Loading Knowledge Graph...")
+        with self.tracer.span("load_kb") as span:
+            self.kb = open_knowledge_base(self.db_file, self.kb_file)
+            span["entries"] = len(self.kb)
+
+        self.progress(f"🔎 Loading Semantic Search ({self.retriever_precision})...")
+        with self.tracer.span("load_retriever"):
+            self.retriever = self._load_retriever()
+        # Only the pattern column is needed up front; responses are read on retrieval
+        corpus_text = self.kb.pattern_texts()
+        with self.tracer.span("vectorize_db") as span:
+            span["artifact"] = self._vectorize_database(corpus_text)
+            cache = self.embedding_cache.stats()
+            span.update(cache_hits=cache['hits'], cache_misses=cache['misses'])
+        if not span["artifact"]:
+            self.progress(f"💾 Embedding cache: {cache['hits']} hits / {cache['misses']} misses")
+        if corpus_text and (LEXICAL_FAST_PATH or HYBRID_WEIGHT > 0):
+            with self.tracer.span("build_lexical"):
+                self.lexical = BM25Index(corpus_text)
+            self.progress(f"🔤 Lexical index: {len(self.lexical.postings)} terms")
+        self._mark_ready("retrieval_ready", self.retrieval_ready)
+
+    def _load_generator_stage(self):
+        self.progress(f"🤖 Loading Generator ({self.model_name}, {self.generator_precision})...")
+        with self.tracer.span("load_generator"):
+            self.tokenizer, self.model = self._load_generator()
+        self.decoding = DecodingPolicy(
+            self.tokenizer, GENERATION_KWARGS, budget_ms=LATENCY_BUDGET_MS,
+            adaptive=DECODING_POLICY == "adaptive", tokenizer_lock=self._tokenizer_lock
+        )
+        if BATCH_GENERATION:
+            self.scheduler = BatchScheduler(
+                self._generate_batch, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT_MS / 1000
+            )
+        self._mark_ready("generator_ready", self.generator_ready)
+
+    def _mark_ready(self, name, event):
+        elapsed = time.perf_counter() - self.created
+        self.startup_times[name] = elapsed
+        self.tracer.record(name, elapsed * 1000)
+        self.progress(f"✅ {name.replace('_', ' ').capitalize()} after {elapsed:.1f}s")
+        event.set()
+
+    def _mark_reply(self):
+        """Record cold-start-to-first-reply the first time a reply is delivered."""
+        if "first_reply" in self.startup_times: return
+        elapsed = time.perf_counter() - self.created
+        self.startup_times.setdefault("first_reply", elapsed)
+        self.tracer.record("cold_start_to_first_reply", elapsed * 1000)
+
+    def wait_until_ready(self, stage="retrieval", timeout=None):
+        """Block until `stage` ("retrieval" or "generator") is loaded; False on timeout."""
+        event = self.retrieval_ready if stage == "retrieval" else self.generator_ready
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not event.wait(0.1):
+            if self.loading_done.is_set() and not event.is_set():
+                raise RuntimeError(f"{stage} failed to load") from self.load_error
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return True
+
+    def _load_retriever(self):
+        return load_retriever(self.retriever_name, self.retriever_precision)
+
+    def _load_generator(self):
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+        return tokenizer, _apply_precision(model, self.generator_precision)
+
+    def _vectorize_database(self, corpus_text):
+        """Build the search index; True if the vectors came from the offline artifact."""
+        if not corpus_text:
+            return False
+        matrix = self._load_index_artifact(corpus_text)
+        from_artifact = matrix is not None
+        if not from_artifact:
+            # Only new or edited entries hit the encoder; the rest come from disk
+            matrix = self.embedding_cache.encode(
+                corpus_text,
+                lambda texts: self.retriever.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+            )
+        options = {"nprobe": IVF_NPROBE, "quantize": IVF_QUANTIZE} if INDEX_BACKEND == "ivf" else {}
+        self.index = build_index(INDEX_BACKEND, matrix, **options)
+        # Kept (memory-mapped when cached) to rescore hybrid candidates exactly
+        self.embeddings = matrix
+        return from_artifact
+
+    def _load_index_artifact(self, corpus_text):
+        """Embeddings from the offline build, or None when missing or not for this corpus/model."""
+        if not self.index_file:
+            return None
+        if not os.path.exists(os.path.join(self.index_file, "meta.json")):
+            reason = "not built yet"
+        else:
+            try:
+                meta, embeddings = load_index_artifact(self.index_file)
+                reason = artifact_mismatch(meta, self.embedding_model, corpus_text)
+            except ValueError as e:
+                reason = str(e)
+        if reason is None:
+            self.progress(f"📦 Loaded index artifact {self.index_file} ({meta['built_at']})")
+            return embeddings
+        if REQUIRE_INDEX_ARTIFACT:
+            raise ValueError(f"{self.index_file}: {reason}; run `python build_index.py`")
+        if reason != "not built yet":
+            self.progress(f"⚠️ Ignoring {self.index_file}: {reason}. Encoding at startup instead")
+        return None
+
+    def generator_idle(self):
+        """True when no generate() call is running or queued, so a stream would not delay anyone."""
+        if self._generate_lock.locked(): return False
+        return self.scheduler is None or self.scheduler.queue_depth() == 0
+
+    def analyze_tokens(self, text):
+        """Debug function for Sidebar Tokenization"""
+        if not self.generator_ready.is_set(): return []
+        with self._tokenizer_lock:
+            tokens = self.tokenizer.tokenize(text)
+            ids = self.tokenizer.encode(text)
+        # Zip them for display
+        return list(zip(tokens, ids))
+
+    def search(self, query, k=1, prompt=None):
+        """Entry ids and similarity scores of the `k` closest entries.
+
+        Keyword-like queries with a confident BM25 match return it without
+        running the encoder; the rest use semantic (or hybrid) search.
+        `prompt` is the user's own message when `query` adds conversation
+        context; the lexical side only looks at its words.
+        """
+        if self.index is None: return [], []
+        start = time.perf_counter()
+        lexical_scores = None
+        if self.lexical is not None:
+            # The previous reply's words would push every follow-up past LEXICAL_MAX_TERMS
+            terms = tokenize(prompt if prompt is not None else query)
+            with self.tracer.span("lexical_match") as span:
+                lexical_scores = self.lexical.scores(terms)
+                hit = None
+                if LEXICAL_FAST_PATH:
+                    hit = self.lexical.confident_match(
+                        terms, lexical_scores, k=k, max_terms=LEXICAL_MAX_TERMS,
+                        min_coverage=LEXICAL_MIN_COVERAGE, min_margin=LEXICAL_MIN_MARGIN
+                    )
+                span["fast_path"] = hit is not None
+            if hit is not None:
+                self.tracer.record("retrieve_fast", (time.perf_counter() - start) * 1000)
+                return hit
+
+        query_vec = self._encode_query(query)
+        with self.tracer.span("similarity_search", k=k):
+            if lexical_scores is not None and HYBRID_WEIGHT > 0:
+                result = self._hybrid_search(query_vec, lexical_scores, k)
+            else:
+                result = self.index.search(query_vec, k=k)
+        self.tracer.record("retrieve_neural", (time.perf_counter() - start) * 1000)
+        return result
+
+    def _hybrid_search(self, query_vec, lexical_scores, k):
+        """Rerank the union of the semantic and lexical candidates by a weighted score.
+
+        The BM25 part is relative to the best candidate, so the blend only
+        orders them; the cosine is returned as the score so the
+        MIN_RETRIEVAL_SCORE cutoff means what it did without BM25.
+        """
+        semantic_ids, _ = self.index.search(query_vec, k=HYBRID_CANDIDATES)
+        candidates = np.union1d(semantic_ids, self.lexical.top(lexical_scores, HYBRID_CANDIDATES))
+        cosine = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query_vec
+        bm25 = lexical_scores[candidates]
+        if bm25.max() > 0:
+            bm25 = bm25 / bm25.max()
+        scores = (1 - HYBRID_WEIGHT) * cosine + HYBRID_WEIGHT * bm25
+        order = np.argsort(-scores)[:k]
+        return candidates[order], cosine[order]
+
+    def retrieval_stats(self):
+        """Share of searches that took the lexical fast path and the time it saved."""
+        snapshot = self.tracer.snapshot()
+        fast = snapshot.get("retrieve_fast")
+        neural = snapshot.get("retrieve_neural")
+        n_fast = fast["count"] if fast else 0
+        n_neural = neural["count"] if neural else 0
+        if not n_fast + n_neural: return None
+        stats = {
+            "queries": n_fast + n_neural,
+            "fast_path": n_fast,
+            "fast_fraction": n_fast / (n_fast + n_neural),
+            "fast_ms": fast["mean_ms"] if fast else None,
+            "neural_ms": neural["mean_ms"] if neural else None,
+            "saved_ms": None,
+        }
+        if fast and neural:
+            stats["saved_ms"] = n_fast * (neural["mean_ms"] - fast["mean_ms"])
+        return stats
+
+    def retrieve(self, query, prompt=None):
+        ids, scores = self.search(query, prompt=prompt)
+        if not len(ids): return None, 0.0
+        return self._pick_advice(int(ids[0]), prompt if prompt is not None else query), float(scores[0])
+
+    def _encode_query(self, query):
+        key = normalize_query(query)
+        with self.tracer.span("query_encode", cached=False) as span:
+            if self.query_cache is not None:
+                query_vec = self.query_cache.get(key)
+                if query_vec is not None:
+                    span["cached"] = True
+                    return query_vec
+            with self._retriever_lock:
+                query_vec = self.retriever.encode(key, convert_to_numpy=True, normalize_embeddings=True)
+            if self.query_cache is not None:
+                self.query_cache.put(key, query_vec)
+            return query_vec
+
+    def _clean_responses(self, idx):
+        """Sanitized candidate responses of entry `idx`; live cleaning only for stale entries."""
+        # Precomputed at ingest; stale or missing ones are cleaned on first use
+        clean = self.kb.clean_responses(idx)
+        if clean is None:
+            clean = self._live_clean.get(idx)
+            if clean is None:
+                clean = [DataSanitizer.clean(r) for r in self.kb.responses(idx)]
+                self._live_clean[idx] = clean
+        return clean
+
+    def _clean_response(self, idx):
+        return self._clean_responses(idx)[0]
+
+    def _pick_advice(self, idx, query):
+        """Merged entries hold several answers; use the one sharing most words with the query."""
+        options = self._clean_responses(idx)
+        if len(options) == 1: return options[0]
+        terms = set(tokenize(query))
+        return max(options, key=lambda r: len(terms & set(tokenize(r))))
+
+    def generate_response(self, user_input, clean_advice):
+        if not self.generator_ready.is_set():
+            return self._retrieval_only_reply(clean_advice), clean_advice
+        reply_key = self._reply_key(user_input, clean_advice)
+        if reply_key is not None:
+            pooled = self.reply_pool.pick(reply_key)
+            if pooled is not None:
+                self._mark_reply()
+                return pooled, clean_advice
+
+        response = self._generate_accepted(self._build_prompt(user_input, clean_advice), clean_advice)
+        self._mark_reply()
+        if response is None:
+            return FALLBACK_REPLY, clean_advice
+        if reply_key is not None:
+            self.reply_pool.add(reply_key, response)
+        return response, clean_advice
+
+    def _retrieval_only_reply(self, clean_advice):
+        """Answer with the sanitized advice itself while the generator warms up."""
+        self.tracer.event("retrieval_only_reply")
+        self._mark_reply()
+        return clean_advice if clean_advice else FALLBACK_REPLY
+
+    def _generate_accepted(self, input_text, clean_advice):
+        """First (or best) candidate passing _verify_quality, or None."""
+        plan = self.decoding.plan(clean_advice)
+        if CANDIDATE_MODE == "parallel":
+            candidates = [self._clean_artifacts(c) for c in self._generate(input_text, plan)]
+            passing = [c for c in candidates if self._accept(c, plan)]
+            if passing:
+                return max(passing, key=lambda c: self._score_candidate(c, clean_advice))
+            return None
+
+        for attempt in range(2):
+            response = self._clean_artifacts(self._generate(input_text, plan)[0])
+            
+            if self._accept(response, plan):
+                return response
+
+        return None
+
+    def _accept(self, text, plan=None):
+        """_verify_quality that also records why a candidate was rejected."""
+        reason = self._rejection_reason(text)
+        if reason is not None:
+            self.tracer.event("quality_reject", reason=reason)
+        if plan is not None:
+            self.decoding.record_outcome(plan, reason is None)
+        return reason is None
+
+    def stream_response(self, user_input, clean_advice):
+        """Streaming variant of generate_response; see ReplyStream."""
+        return ReplyStream(
+            self, self._build_prompt(user_input, clean_advice), clean_advice,
+            reply_key=self._reply_key(user_input, clean_advice)
+        )
+
+    def _reply_key(self, user_input, clean_advice):
+        if self.reply_pool is None: return None
+        return normalize_query(user_input), hash(clean_advice)
+
+    def cache_stats(self):
+        stats = {}
+        if self.query_cache is not None: stats["query_embeddings"] = self.query_cache.stats()
+        if self.reply_pool is not None: stats["replies"] = self.reply_pool.stats()
+        return stats
+
+    def decoding_stats(self):
+        """Per decoding tier: generate() latency, early stops and quality pass rate."""
+        return self.decoding.stats() if self.decoding is not None else {}
+
+    def _build_prompt(self, user_input, clean_advice):
+        # PROMPT: Force "Supportive" persona and remove locations
+        return (
+            f"Task: You are a helpful AI counselor. \n"
+            f"User says: '{user_input}'. \n"
+            f"Reference Advice: {clean_advice}\n\n"
+            f"Instructions:\n"
+            f"1. Answer the user using the Advice.\n"
+            f"2. REMOVE any specific locations (like 'Houston'), office hours, or doctor names.\n"
+            f"3. Expand with an example if possible."
+        )
+
+    def _clean_artifacts(self, response):
+        for marker in ARTIFACT_MARKERS:
+            response = response.replace(marker, "")
+        return response.strip()
+
+    def _stream_view(self, partial):
+        """Cleaned partial text, holding back a tail that may still become an artifact marker.
+
+        Checked and shown mid-stream, so a streamed candidate is judged on the
+        same text as a batched one ("Instructions" is only dropped once the
+        ":" arrives).
+        """
+        text = self._clean_artifacts(partial)
+        for marker in ARTIFACT_MARKERS:
+            for n in range(len(marker) - 1, 0, -1):
+                if text.endswith(marker[:n]):
+                    return text[:-n].rstrip()
+        return text
+
+    def _generate(self, input_text, plan=None):
+        """Return the list of decoded candidates for one prompt (GENERATION_KWARGS without a plan)."""
+        plan = plan or self.decoding.base
+        with self.tracer.span("generate_attempt", batched=self.scheduler is not None, tier=plan.tier) as span:
+            if self.scheduler is not None:
+                candidates, timings, batch_size = self.scheduler.generate((input_text, plan))
+            else:
+                candidates, timings, batch_size = self._generate_batch([(input_text, plan)])[0]
+            # Measured on the batch worker; attach them to this message's trace
+            for name, ms in timings.items():
+                self.tracer.record(name, ms, batch=batch_size)
+            span["candidates"] = len(candidates)
+        return candidates
+
+    def _generate_batch(self, requests):
+        """Pad the prompts, run one generate() over all of them and decode each.
+
+        `requests` are (prompt, DecodingPlan) pairs; the batch decodes with
+        their merged plan. Returns (candidates, timings, batch size) per
+        prompt. With several candidates the encoder still runs once per
+        prompt; generate() expands its output for the sampled sequences.
+        """
+        from transformers import StoppingCriteriaList
+        prompts = [prompt for prompt, _ in requests]
+        plan = DecodingPolicy.merge([p for _, p in requests])
+        n = NUM_CANDIDATES if CANDIDATE_MODE == "parallel" else 1
+        timings = {}
+        start = time.perf_counter()
+        with self._tokenizer_lock:
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        timings["tokenize"] = (time.perf_counter() - start) * 1000
+        with self._generate_lock:
+            # The budget clock starts once this batch has the model
+            budget = self.decoding.stopping_criteria(plan)
+            start = time.perf_counter()
+            outputs = self.model.generate(
+                inputs.input_ids, attention_mask=inputs.attention_mask, num_return_sequences=n,
+                stopping_criteria=StoppingCriteriaList([budget] if budget else []), **plan.kwargs
+            )
+        timings["model_generate"] = (time.perf_counter() - start) * 1000
+        stopped = budget.stopped if budget else None
+        self.decoding.record_call([p.tier for _, p in requests], timings["model_generate"],
+                                  outputs.shape[1] - 1, stopped)
+        if stopped:
+            self.tracer.event("early_stop", how=stopped)
+        start = time.perf_counter()
+        with self._tokenizer_lock:
+            decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        timings["decode"] = (time.perf_counter() - start) * 1000
+        return [(decoded[i * n:(i + 1) * n], timings, len(prompts)) for i in range(len(prompts))]
+
+    def _score_candidate(self, text, clean_advice):
+        """Cheap ranking: prefer varied wording, grounding in the advice and some length."""
+        words = re.findall(r"[a-z']+", text.lower())
+        if not words: return 0.0
+        vocab = set(words)
+        advice_vocab = set(re.findall(r"[a-z']+", clean_advice.lower()))
+        distinct = len(vocab) / len(words)
+        grounding = len(vocab & advice_vocab) / len(vocab)
+        length = min(len(words), 60) / 60
+        return distinct + 0.5 * grounding + 0.5 * length
+
+    def _stream_candidate(self, input_text, usage, plan=None):
+        """Yield the decoded text so far after each token; closing it aborts decoding."""
+        from transformers import StoppingCriteriaList
+        _AbortCriteria, _CountingStreamer = _streaming_classes()
+        plan = plan or self.decoding.base
+        with self.tracer.span("tokenize"), self._tokenizer_lock:
+            input_ids = self.tokenizer(input_text, return_tensors="pt").input_ids
+        streamer = _CountingStreamer(self.tokenizer, self._tokenizer_lock)
+        abort = threading.Event()
+        errors = []
+        run_stats = {}
+
+        def run():
+            try:
+                with self._generate_lock:
+                    budget = self.decoding.stopping_criteria(plan)
+                    criteria = [_AbortCriteria(abort)] + ([budget] if budget else [])
+                    start = time.perf_counter()
+                    self.model.generate(
+                        input_ids, streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList(criteria), **plan.kwargs
+                    )
+                    run_stats["ms"] = (time.perf_counter() - start) * 1000
+                    run_stats["stopped"] = budget.stopped if budget else None
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        text = ""
+        completed = False
+        try:
+            for chunk in streamer:
+                text += chunk
+                yield text
+            completed = True
+        finally:
+            # The streamer's queue is unbounded, so generate() never blocks on
+            # it; an abandoned candidate stops at its next decoding step.
+            # (Draining here would wait forever after a completed stream.)
+            abort.set()
+            worker.join()
+            usage["tokens"] += streamer.token_count
+        if errors:
+            raise errors[0]
+        # Candidates abandoned by the consumer would understate the tier's latency
+        if completed:
+            self.decoding.record_call([plan.tier], run_stats["ms"], streamer.token_count, run_stats["stopped"])
+            if run_stats["stopped"]:
+                self.tracer.event("early_stop", how=run_stats["stopped"])
+
+    def _has_banned_phrase(self, text):
+        lower = text.lower()
+        return any(phrase in lower for phrase in BANNED_PHRASES)
+
+    def _rejection_reason(self, text):
+        if self._has_banned_phrase(text): return "banned"
+        if len(text) < 20: return "too_short"
+        return None
+
+    def _verify_quality(self, text):
+        return self._rejection_reason(text) is None
@@ -0,0 +1,112 @@
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_query(text):
+    """Cache key for a message: casefolded, whitespace collapsed, edge punctuation dropped."""
+    return _SPACES.sub(' ', text.casefold()).strip(" .,!?;:'\"")
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl is not None and time.monotonic() - item[0] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def peek(self, key):
+        """Like get() but without touching recency or hit counters."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl is not None and time.monotonic() - item[0] > self.ttl):
+                return None
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class ReplyPool:
+    """Bounded cache of (user input, advice) -> accepted generations.
+
+    Until a key has `pool_size` replies every request generates a new one;
+    after that a random pooled reply is served, so answers still vary.
+    """
+
+    def __init__(self, max_keys, pool_size, ttl=None):
+        self.pool_size = pool_size
+        self.cache = TTLCache(max_keys, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def pick(self, key):
+        pool = self.cache.peek(key)
+        if pool is not None and len(pool) >= self.pool_size:
+            self.hits += 1
+            return random.choice(pool)
+        self.misses += 1
+        return None
+
+    def add(self, key, reply):
+        pool = list(self.cache.peek(key) or [])
+        if reply not in pool:
+            pool = (pool + [reply])[-self.pool_size:]
+        self.cache.put(key, pool)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            **self.cache.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,90 @@
+import re
+
+_TOKEN = re.compile(r"\w+(?:'\w+)*")
+
+
+def tokenize(text):
+    """Casefolded word tokens; hyphens and punctuation act as word breaks."""
+    return _TOKEN.findall(text.casefold())
+
+
+def load_lexicon(path):
+    """Read one phrase per line, skipping blanks and '#' comments."""
+    phrases = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                phrases.append(line)
+    return phrases
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over word tokens.
+
+    Phrases only match on whole words ("skill" does not contain "kill"), and a
+    message is scanned in a single pass whose cost does not depend on how
+    many phrases are loaded.
+    """
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._size = 0
+        for phrase in phrases:
+            self._add(phrase)
+        self._link()
+
+    def __len__(self):
+        return self._size
+
+    def _add(self, phrase):
+        tokens = tokenize(phrase)
+        if not tokens: return
+        state = 0
+        for tok in tokens:
+            nxt = self._goto[state].get(tok)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][tok] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if phrase not in self._out[state]:
+            self._out[state] = self._out[state] + (phrase,)
+            self._size += 1
+
+    def _link(self):
+        # Breadth-first so every failure target is finished before it is used
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for tok, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and tok not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(tok, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _states(self, text):
+        state = 0
+        for tok in tokenize(text):
+            while state and tok not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(tok, 0)
+            yield state
+
+    def search(self, text):
+        """Return the first phrase found in `text`, or None."""
+        for state in self._states(text):
+            if self._out[state]:
+                return self._out[state][0]
+        return None
+
+    def find_all(self, text):
+        found = []
+        for state in self._states(text):
+            found.extend(self._out[state])
+        return found
@@ -0,0 +1,60 @@
+import re
+
+# Bump whenever clean() changes. Stored `clean_response` fields from an older
+# version are redone the next time the database is opened for ingest
+# (KnowledgeStore) or by running `python sanitizer.py`.
+SANITIZER_VERSION = 1
+
+_URL = re.compile(r'http\S+|www\.\S+')
+_EMAIL = re.compile(r'\S+@\S+')
+_NAME = re.compile(r'(?i)\b(dr\.|mr\.|mrs\.|ms\.)\s+[A-Z][a-z]+')
+_OFFICE = re.compile(r'(?i)(serving|located in|office in)\s+[A-Z][a-z]+')
+_SPACES = re.compile(r'\s+')
+
+
+#DATA SANITIZATION LAYER
+class DataSanitizer:
+    @staticmethod
+    def clean(text):
+        if not text: return ""
+        # Remove URLs
+        text = _URL.sub('', text)
+        # Remove emails
+        text = _EMAIL.sub('', text)
+        # Genericize names
+        text = _NAME.sub('the therapist', text)
+        # Remove office locations
+        text = _OFFICE.sub('', text)
+        text = _SPACES.sub(' ', text).strip()
+        return text[:1000]
+
+
+def is_sanitized(entry):
+    if "responses" in entry and "clean_responses" not in entry: return False
+    return entry.get("sanitizer_version") == SANITIZER_VERSION and "clean_response" in entry
+
+
+def sanitize_entries(entries):
+    """Ingest stage: store the cleaned response(s) and sanitizer version on each entry."""
+    for entry in entries:
+        if not is_sanitized(entry):
+            entry["clean_response"] = DataSanitizer.clean(entry.get("response", ""))
+            # Entries merged by compact_db.py carry several candidate responses
+            if "responses" in entry:
+                entry["clean_responses"] = [DataSanitizer.clean(r) for r in entry["responses"]]
+            entry["sanitizer_version"] = SANITIZER_VERSION
+    return entries
+
+
+if __name__ == "__main__":
+    import argparse
+    from ingest import DB_FILE, KnowledgeStore
+
+    parser = argparse.ArgumentParser(description="Re-sanitize knowledge base entries cleaned by an older version.")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    args = parser.parse_args()
+
+    # Opening the store rewrites any stale entries
+    store = KnowledgeStore(args.db)
+    print(f"✅ {len(store)} entries sanitized with v{SANITIZER_VERSION}.")
+    print("💡 Re-run `python kb_format.py` if you use the binary knowledge base.")
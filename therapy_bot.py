@@ -1,144 +1,53 @@
 import streamlit as st
-import json
-import torch
-import re
-import random
-from sentence_transformers import SentenceTransformer, util
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from conversation_store import ConversationStore
+from neural_engine import (
+    BACKGROUND_LOADING, LOW_CONFIDENCE_REPLY, MIN_RETRIEVAL_SCORE, NeuralEngine, SafetySystem, contextual_query
+)
 
 PAGE_TITLE = "NeuroTherapy AI: Ultimate Edition"
 PAGE_ICON = "🧠"
-DATABASE_FILE = "mindfulness_db.json"
-MODEL_NAME = "google/flan-t5-base"
-
-#DATA SANITIZATION LAYER
-class DataSanitizer:
-    @staticmethod
-    def clean(text):
-        if not text: return ""
-        # Remove URLs
-        text = re.sub(r'http\S+|www\.\S+', '', text)
-        # Remove emails
-        text = re.sub(r'\S+@\S+', '', text)
-        # Genericize names
-        text = re.sub(r'(?i)\b(dr\.|mr\.|mrs\.|ms\.)\s+[A-Z][a-z]+', 'the therapist', text)
-        # Remove office locations
-        text = re.sub(r'(?i)(serving|located in|office in)\s+[A-Z][a-z]+', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text[:1000]
-
-
-# SAFETY SYSTEM
-class SafetySystem:
-    def __init__(self):
-        self.crisis_keywords = [
-            "suicide", "kill myself", "want to die", "end it all", "shoot myself",
-            "self-harm", "cutting", "overdose", "hurt myself", "kill", "killing"
-        ]
-
-
-    def scan(self, text):
-        if any(word in text.lower() for word in self.crisis_keywords):
-            return "🚨 **CRITICAL ALERT:** Please contact emergency services (988) immediately."
-        return None
-
-# --- 3. NEURAL ENGINE ---
-class NeuralEngine:
-    def __init__(self):
-        self.tokenizer = None
-        self.model = None
-        self.retriever = None
-        self.corpus_embeddings = None
-        self.db_data = []
-        self._initialize_models()
-
-    def _initialize_models(self):
-        with st.status("Initializing Neural Core...", expanded=True) as status:
-            st.write("📂 Loading Knowledge Graph...")
-            try:
-                with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-                    self.db_data = json.load(f)
-            except Exception:
-                self.db_data = []
-            
-            st.write("🔎 Loading Semantic Search...")
-            self.retriever = SentenceTransformer('all-MiniLM-L6-v2')
-            self._vectorize_database()
-
-            st.write(f"🤖 Loading Generator ({MODEL_NAME})...")
-            self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
-            
-            status.update(label="System Online", state="complete", expanded=False)
-
-    def _vectorize_database(self):
-        corpus_text = []
-        self.responses = []
-        for entry in self.db_data:
-            pat_list = entry.get('patterns', [])
-            if isinstance(pat_list, str): pat_list = [pat_list]
-            corpus_text.append(" ".join(pat_list))
-            self.responses.append(entry.get('response', ""))
-            
-        if corpus_text:
-            self.corpus_embeddings = self.retriever.encode(corpus_text, convert_to_tensor=True)
-
-    def analyze_tokens(self, text):
-        """Debug function for Sidebar Tokenization"""
-        tokens = self.tokenizer.tokenize(text)
-        ids = self.tokenizer.encode(text)
-        # Zip them for display
-        return list(zip(tokens, ids))
-
-    def retrieve(self, query):
-        if self.corpus_embeddings is None: return None, 0.0
-        query_vec = self.retriever.encode(query, convert_to_tensor=True)
-        scores = util.cos_sim(query_vec, self.corpus_embeddings)[0]
-        best_idx = scores.argmax().item()
-        return self.responses[best_idx], scores[best_idx].item()
-
-    def generate_response(self, user_input, db_advice):
-        clean_advice = DataSanitizer.clean(db_advice)
-        
-        # PROMPT: Force "Supportive" persona and remove locations
-        input_text = (
-            f"Task: You are a helpful AI counselor. \n"
-            f"User says: '{user_input}'. \n"
-            f"Reference Advice: {clean_advice}\n\n"
-            f"Instructions:\n"
-            f"1. Answer the user using the Advice.\n"
-            f"2. REMOVE any specific locations (like 'Houston'), office hours, or doctor names.\n"
-            f"3. Expand with an example if possible."
-        )
-        
-        input_ids = self.tokenizer(input_text, return_tensors="pt").input_ids
-
-        for attempt in range(2):
-            outputs = self.model.generate(
-                input_ids,
-                max_length=350,
-                min_length=50,
-                do_sample=True,
-                temperature=0.7,
-                repetition_penalty=2.5,
-                no_repeat_ngram_size=3
-            )
-            response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Clean artifacts
-            response = response.replace("Instructions:", "").replace("Reference Advice:", "").strip()
-            
-            if self._verify_quality(response):
-                return response, clean_advice
 
-        return "I hear you. Could you tell me more about how this is affecting your daily life?", clean_advice
-
-    def _verify_quality(self, text):
-        lower = text.lower()
-        if "instruction" in lower: return False
-        if "houston" in lower or "office" in lower: return False 
-        if len(text) < 20: return False
-        return True
+GREETING = "Hello. I am here to listen. How are you feeling?"
+
+# Stream tokens into the chat bubble as they are decoded. A streamed reply
+# is decoded alone (one candidate, no micro-batching) and holds the generator
+# until it is done, so users streaming at the same time wait for each other.
+# With STREAM_WHEN_IDLE only messages arriving while the generator is idle
+# are streamed; under load they go through the batched path (BATCH_GENERATION)
+# and the reply appears at once. Set it to False to always stream (one user).
+STREAM_RESPONSES = True
+STREAM_WHEN_IDLE = True
+# Earlier messages (outside the store's live window) loaded per click
+HISTORY_PAGE_SIZE = 20
+
+# SHARED RESOURCES
+# Loaded once per server process and reused by every browser session.
+# Models load in the background; the page renders while they do.
+@st.cache_resource(show_spinner=False)
+def load_engine():
+    return NeuralEngine(background=BACKGROUND_LOADING)
+
+def wait_for_retrieval(engine):
+    """Show load progress until the chat can answer (retrieval is ready)."""
+    if engine.retrieval_ready.is_set(): return
+    with st.status("Initializing Neural Core...", expanded=True) as status:
+        shown = 0
+        while not engine.wait_until_ready("retrieval", timeout=0.25):
+            for msg in engine.load_messages[shown:]:
+                st.write(msg)
+            shown = len(engine.load_messages)
+        status.update(label="System Online", state="complete", expanded=False)
+
+@st.cache_resource(show_spinner=False)
+def load_safety():
+    return SafetySystem()
+
+def render_message(msg):
+    with st.chat_message(msg["role"]):
+        st.markdown(msg["content"])
+        if "meta" in msg:
+            with st.expander("See Source Context"):
+                st.write(msg["meta"])
 
 # UI SETUP
 st.set_page_config(page_title=PAGE_TITLE, page_icon=PAGE_ICON, layout="wide")
@@ -152,70 +61,156 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "assistant", "content": "Hello. I am here to listen. How are you feeling?"}]
-if "engine" not in st.session_state:
-    st.session_state.engine = NeuralEngine()
-if "safety" not in st.session_state:
-    st.session_state.safety = SafetySystem()
+# Per-user state is only the conversation: a bounded live window, older turns on disk
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationStore(greeting=GREETING)
+    st.session_state.older_shown = 0
+conversation = st.session_state.conversation
+engine = load_engine()
+safety = load_safety()
 
 #SIDEBAR tokenization
 with st.sidebar:
     st.header("🛠️ Neuro-Debugger")
     st.info("Visualizing how the AI reads your input.")
+    st.caption(f"Session: {len(conversation)} messages, {len(conversation.live)} in memory")
     token_expander = st.expander("🔠 Live Tokenization", expanded=True)
+    timing_expander = st.expander("⏱️ Message Timing")
+    with st.expander("🚀 Startup", expanded=not engine.generator_ready.is_set()):
+        for name, seconds in engine.startup_times.items():
+            st.write(f"{name.replace('_', ' ').capitalize()}: {seconds:.1f}s")
+        if engine.load_error is not None:
+            st.error(f"Loading failed: {engine.load_error}")
+        elif not engine.generator_ready.is_set():
+            st.write("🤖 Generator warming up; replies use the retrieved advice directly.")
+    if stage_stats := engine.tracer.snapshot():
+        with st.expander("📈 Stage Latency"):
+            for name, s in sorted(stage_stats.items()):
+                if s["p50_ms"] is not None:
+                    st.write(f"{name}: p50 {s['p50_ms']:.1f} ms, p95 {s['p95_ms']:.1f} ms ({s['count']})")
+                else:
+                    st.write(f"{name}: {s['count']}")
+    if engine.scheduler is not None:
+        with st.expander("⚙️ Generation Queue"):
+            queue_stats = engine.scheduler.stats()
+            st.write(f"Queue depth: {queue_stats['queue_depth']}")
+            st.write(f"Batch size: avg {queue_stats['avg_batch_size']:.1f}, max {queue_stats['max_batch_size']} "
+                     f"({queue_stats['batches']} batches)")
+            st.write(f"Wait: p50 {queue_stats['wait_ms_p50']:.0f} ms, p95 {queue_stats['wait_ms_p95']:.0f} ms")
+    if cache_stats := engine.cache_stats():
+        with st.expander("🗂️ Caches"):
+            for name, c in cache_stats.items():
+                st.write(f"**{name}**: {c['hit_rate']:.0%} hits ({c['hits']}/{c['hits'] + c['misses']}), "
+                         f"{c['size']}/{c['max_size']} keys, {c['evictions']} evicted")
+    if retrieval_stats := engine.retrieval_stats():
+        with st.expander("⚡ Retrieval Paths"):
+            st.write(f"Lexical fast path: {retrieval_stats['fast_fraction']:.0%} "
+                     f"of {retrieval_stats['queries']} searches")
+            if retrieval_stats["saved_ms"] is not None:
+                st.write(f"Fast {retrieval_stats['fast_ms']:.1f} ms vs neural {retrieval_stats['neural_ms']:.1f} ms, "
+                         f"{retrieval_stats['saved_ms'] / 1000:.1f}s saved in total")
+    if engine.reply_stats:
+        with st.expander("⏱️ Streaming"):
+            recent = list(engine.reply_stats)[-50:]
+            ttfts = [r["ttft_ms"] for r in recent if r["ttft_ms"] is not None]
+            if ttfts:
+                st.write(f"Time to first token: {sum(ttfts) / len(ttfts):.0f} ms (avg of {len(ttfts)})")
+            st.write(f"Decode speed: {sum(r['tokens_per_s'] for r in recent) / len(recent):.1f} tokens/s")
+    if decoding_stats := engine.decoding_stats():
+        with st.expander("🎚️ Decoding Budget"):
+            for tier, d in decoding_stats.items():
+                passed = f"{d['pass_rate']:.0%}" if d["pass_rate"] is not None else "n/a"
+                st.write(f"**{tier}**: p50 {d['latency_ms_p50']:.0f} ms, p95 {d['latency_ms_p95']:.0f} ms, "
+                         f"{d['avg_steps']:.0f} tokens, {d['early_stop_rate']:.0%} stopped early, "
+                         f"{passed} pass quality ({d['calls']} calls)")
 
 st.title(f"{PAGE_ICON} {PAGE_TITLE}")
 st.caption("Features: New Kaggle Database + Live Tokenization + RAG")
 
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
-        if "meta" in msg:
-            with st.expander("See Source Context"):
-                st.write(msg["meta"])
+wait_for_retrieval(engine)
+
+# Only the live window is rendered on each rerun; earlier pages on request
+with engine.tracer.span("render_history", messages=len(conversation.live)):
+    if conversation.archived and conversation.archive_path is None:
+        st.caption(f"{conversation.archived} earlier messages are not kept.")
+    elif conversation.archived:
+        shown = st.session_state.older_shown
+        if shown < conversation.archived and st.button(
+                f"⬆️ Show earlier messages ({conversation.archived - shown} more)"):
+            shown = st.session_state.older_shown = min(shown + HISTORY_PAGE_SIZE, conversation.archived)
+        for msg in conversation.archived_page(conversation.archived - shown, conversation.archived):
+            render_message(msg)
+    for msg in conversation.live:
+        render_message(msg)
 
 if prompt := st.chat_input("Type here..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    conversation.append("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    if alert := st.session_state.safety.scan(prompt):
-        with st.chat_message("assistant"): st.error(alert)
-        st.stop()
-
-    engine = st.session_state.engine
-    
-    # VISUALIZE TOKENS (SIDEBAR)
-    tokens = engine.analyze_tokens(prompt)
-    with token_expander:
-        st.write(f"**Tokens ({len(tokens)}):**")
-        st.code(tokens)
-
-    #  CONTEXT CONSTRUCTION
-    # Combine previous bot answer + current user input for better search
-    search_query = prompt
-    if len(st.session_state.messages) > 2:
-        prev_bot = st.session_state.messages[-2]["content"]
-        search_query = f"{prev_bot[-60:]} {prompt}"
-
-    with st.chat_message("assistant"):
-        with st.status("🧠 Processing...", expanded=True) as status:
+    # Every stage below records a span into this message's trace
+    with engine.tracer.trace("message") as trace:
+        if alert := safety.scan(prompt):
+            with st.chat_message("assistant"): st.error(alert)
+            st.stop()
+
+        # VISUALIZE TOKENS (SIDEBAR)
+        tokens = engine.analyze_tokens(prompt)
+        with token_expander:
+            if tokens:
+                st.write(f"**Tokens ({len(tokens)}):**")
+                st.code(tokens)
+            else:
+                st.write("Tokenizer still loading...")
+
+        #  CONTEXT CONSTRUCTION
+        # Combine previous bot answer + current user input for better search
+        search_query = contextual_query(conversation.previous_reply(), prompt)
+
+        stream = None
+        with st.chat_message("assistant"):
+            with st.status("🧠 Processing...", expanded=True) as status:
             
-            st.write(f"🔍 Searching DB for: '{search_query[:50]}...'")
-            raw_advice, score = engine.retrieve(search_query)
+                st.write(f"🔍 Searching DB for: '{search_query[:50]}...'")
+                advice, score = engine.retrieve(search_query, prompt)
             
-            if score < 0.20:
-                status.update(label="⚠️ Low Confidence", state="error")
-                final_response = "I'm listening. Could you clarify that a little bit?"
-                clean_context = "None"
+                if score < MIN_RETRIEVAL_SCORE:
+                    status.update(label="⚠️ Low Confidence", state="error")
+                    final_response = LOW_CONFIDENCE_REPLY
+                    clean_context = "None"
+                else:
+                    st.write(f"✅ Context Found (Score: {score:.2f})")
+                    if not engine.generator_ready.is_set():
+                        # Generator still loading: answer with the retrieved advice
+                        final_response, clean_context = engine.generate_response(prompt, advice)
+                        status.update(label="Retrieved Advice (generator warming up)", state="complete", expanded=False)
+                    elif STREAM_RESPONSES and (not STREAM_WHEN_IDLE or engine.generator_idle()):
+                        st.write("✍️ Generating & Filtering...")
+                        stream = engine.stream_response(prompt, advice)
+                        status.update(label="Streaming Response", state="complete", expanded=False)
+                    else:
+                        st.write("✍️ Generating & Filtering...")
+                        final_response, clean_context = engine.generate_response(prompt, advice)
+                        status.update(label="Response Ready", state="complete", expanded=False)
+
+            if stream is not None:
+                bubble = st.empty()
+                for partial in stream:
+                    bubble.markdown(partial + " ▌")
+                final_response, clean_context = stream.text, stream.clean_advice
+                bubble.markdown(final_response)
             else:
-                st.write(f"✅ Context Found (Score: {score:.2f})")
-                st.write("✍️ Generating & Filtering...")
-                final_response, clean_context = engine.generate_response(prompt, raw_advice)
-                status.update(label="Response Ready", state="complete", expanded=False)
+                st.markdown(final_response)
 
             meta = {"context_used": clean_context[:100] + "..."}
-
-        st.markdown(final_response)
-        st.session_state.messages.append({"role": "assistant", "content": final_response, "meta": meta})
\ No newline at end of file
+            if stream is not None:
+                meta["timing"] = stream.stats
+            conversation.append("assistant", final_response, meta)
+
+    with timing_expander:
+        for span in trace.spans:
+            if span["ms"] is not None:
+                st.write(f"{span['name']}: {span['ms']:.1f} ms")
+            else:
+                st.write(f"{span['name']}: {span.get('reason', '')}")
+        st.write(f"**Total: {trace.total_ms:.0f} ms**")
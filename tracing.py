@@ -0,0 +1,163 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def percentile(values, pct):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Trace:
+    """Spans and events recorded while handling one message (or one startup)."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.spans = []
+        self.total_ms = None
+
+    def to_record(self):
+        return {
+            "ts": round(self.started, 3),
+            "trace": self.kind,
+            "trace_id": self.trace_id,
+            "total_ms": self.total_ms,
+            "spans": self.spans,
+        }
+
+
+class Tracer:
+    """Lightweight span timing with a JSON Lines sink and rolling aggregates.
+
+    Only span names, durations and small numeric/label attributes are kept;
+    callers must never pass message text as an attribute. The log is rotated
+    once it reaches `log_max_bytes`, keeping `log_backups` old files
+    (log_file.1 is the newest).
+    """
+
+    def __init__(self, log_file=None, metrics_file=None, window=1000, metrics_interval=10.0,
+                 log_max_bytes=10 * 2**20, log_backups=3):
+        self.log_file = log_file
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self.metrics_file = metrics_file
+        self.window = window
+        self.metrics_interval = metrics_interval
+        self._durations = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._last_metrics_write = 0.0
+
+    @contextmanager
+    def trace(self, kind):
+        """Collect every span recorded in this context into one Trace."""
+        trace = Trace(kind)
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.total_ms = round((time.perf_counter() - start) * 1000, 2)
+            _current_trace.reset(token)
+            self._observe(f"{kind}_total", trace.total_ms)
+            self._flush(trace)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000, **attrs)
+
+    def record(self, name, ms, **attrs):
+        """Record a span measured elsewhere (e.g. on a worker thread)."""
+        self._observe(name, ms)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({"name": name, "ms": round(ms, 2), **attrs})
+
+    def event(self, name, **attrs):
+        """Count an occurrence without a duration (e.g. a rejected candidate)."""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({"name": name, "ms": None, **attrs})
+
+    def _observe(self, name, ms):
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+            self._durations[name].append(ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def _flush(self, trace):
+        with self._lock:
+            if self.log_file:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(trace.to_record()) + "\n")
+                    size = f.tell()
+                if self.log_max_bytes and size >= self.log_max_bytes:
+                    self._rotate_log()
+            due = self.metrics_file and time.monotonic() - self._last_metrics_write >= self.metrics_interval
+            if due:
+                self._last_metrics_write = time.monotonic()
+        if due:
+            self.write_metrics()
+
+    def _rotate_log(self):
+        """metrics.jsonl -> .1 -> .2 ...; the oldest beyond `log_backups` is deleted."""
+        for i in range(self.log_backups, 0, -1):
+            older = f"{self.log_file}.{i}"
+            newer = f"{self.log_file}.{i - 1}" if i > 1 else self.log_file
+            if os.path.exists(newer):
+                os.replace(newer, older)
+        if not self.log_backups:
+            os.remove(self.log_file)
+
+    def snapshot(self):
+        """Rolling aggregates per span name over the last `window` samples."""
+        with self._lock:
+            durations = {k: list(v) for k, v in self._durations.items()}
+            counts = dict(self._counts)
+        stats = {}
+        for name, count in counts.items():
+            values = durations.get(name, [])
+            stats[name] = {
+                "count": count,
+                "mean_ms": sum(values) / len(values) if values else None,
+                "p50_ms": percentile(values, 50) if values else None,
+                "p95_ms": percentile(values, 95) if values else None,
+                "max_ms": max(values) if values else None,
+            }
+        return stats
+
+    def prometheus_text(self):
+        lines = [
+            "# TYPE therapy_span_count counter",
+            "# TYPE therapy_span_ms summary",
+        ]
+        for name, s in sorted(self.snapshot().items()):
+            lines.append(f'therapy_span_count{{span="{name}"}} {s["count"]}')
+            if s["p50_ms"] is not None:
+                lines.append(f'therapy_span_ms{{span="{name}",quantile="0.5"}} {s["p50_ms"]:.3f}')
+                lines.append(f'therapy_span_ms{{span="{name}",quantile="0.95"}} {s["p95_ms"]:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        """Atomically rewrite the metrics file (Prometheus textfile format)."""
+        tmp = self.metrics_file + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, self.metrics_file)
@@ -1,10 +1,11 @@
-import json
 import os
 import glob
 import pandas as pd
 import kagglehub
+from build_index import build_index_artifact
+from ingest import DB_FILE, KnowledgeStore, csv_chunks, ingest_chunks
 
-OUTPUT_FILE = "mindfulness_db.json"
+OUTPUT_FILE = DB_FILE
 
 def train_brain():
     print("⬇️  Downloading dataset from Kaggle...")
@@ -24,12 +25,10 @@ def train_brain():
     csv_path = csv_files[0]
     print(f"📂 Processing: {csv_path}")
 
-    df = pd.read_csv(csv_path)
-    
-    new_entries = []
-    
+    # only the header is read here; rows are streamed in chunks below
+    columns = pd.read_csv(csv_path, nrows=0).columns
 
-    print(f"   Columns found: {list(df.columns)}")
+    print(f"   Columns found: {list(columns)}")
     
    
     col_map = {
@@ -37,40 +36,30 @@ def train_brain():
         'answer': ['Response', 'Output', 'Assistant', 'response', 'completion']
     }
     
-    q_col = next((c for c in df.columns if c in col_map['question']), None)
-    a_col = next((c for c in df.columns if c in col_map['answer']), None)
+    q_col = next((c for c in columns if c in col_map['question']), None)
+    a_col = next((c for c in columns if c in col_map['answer']), None)
 
     if not q_col or not a_col:
         print("❌ Could not automatically identify Question/Answer columns.")
-        print(f"   Please open the CSV and check headers: {df.columns}")
+        print(f"   Please open the CSV and check headers: {columns}")
         return
 
     print(f"   Mapping: Question='{q_col}' -> Answer='{a_col}'")
 
-    for _, row in df.iterrows():
-        q_text = str(row[q_col]).strip()
-        a_text = str(row[a_col]).strip()
-        
-        if len(q_text) > 5 and len(a_text) > 10:
-            new_entries.append({
-                "patterns": [q_text],
-                "response": a_text,
-                "source": "kaggle_birdy654"
-            })
+    store = KnowledgeStore(OUTPUT_FILE)
+    accepted, added = ingest_chunks(
+        store, csv_chunks(csv_path), q_col, a_col, {"source": "kaggle_birdy654"},
+        min_question=5, min_answer=10
+    )
 
-    print(f"💾 Saving {len(new_entries)} new conversational pairs...")
-    
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, 'r', encoding='utf-8') as f:
-            existing = json.load(f)
-        combined = existing + new_entries
-    else:
-        combined = new_entries
-        
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(combined, f, indent=2, ensure_ascii=False)
-        
-    print(f"🚀 Success! Database now has {len(combined)} entries.")
+    print(f"💾 Added {added} new conversational pairs ({accepted - added} already present).")
+    print(f"🚀 Success! Database now has {len(store)} entries.")
+
+    # Encode the corpus offline so the bot only loads the index artifact
+    try:
+        build_index_artifact(OUTPUT_FILE)
+    except Exception as e:
+        print(f"❌ Index build failed: {e} (the bot will encode at startup instead)")
 
 if __name__ == "__main__":
     train_brain()
\ No newline at end of file
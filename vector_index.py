@@ -0,0 +1,176 @@
+import numpy as np
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # Skip the copy when the encoder already produced unit vectors
+    if np.allclose(norms, 1.0, atol=1e-3):
+        return vectors
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class ExactIndex:
+    """Brute-force cosine search over the full float32 matrix."""
+    name = "exact"
+
+    def __init__(self, vectors):
+        self.vectors = _normalize(vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, query, k=1):
+        query = _normalize(query).reshape(-1)
+        scores = self.vectors @ query
+        top = _top_k(scores, k)
+        return top, scores[top]
+
+
+class IVFIndex:
+    """Inverted-file index: k-means clusters, only `nprobe` of them are scanned.
+
+    Raising `nprobe` trades latency for recall; `nprobe == n_lists` is exact
+    up to quantization error. With `quantize="int8"` the vectors are kept as
+    per-dimension scaled int8 codes, a quarter of the float32 footprint.
+    """
+    name = "ivf"
+
+    def __init__(self, vectors, n_lists=None, nprobe=8, quantize=None, iterations=10, seed=0):
+        vectors = _normalize(vectors)
+        n = len(vectors)
+        self.n_lists = n_lists or max(1, min(n, int(4 * np.sqrt(n))))
+        self.nprobe = nprobe
+        self.quantize = quantize
+
+        self.centroids = self._train(vectors, iterations, np.random.default_rng(seed))
+        assign = self._assign(vectors)
+
+        # Store vectors grouped by list so each probe is one contiguous slice
+        order = np.argsort(assign, kind="stable")
+        self.ids = order
+        self.offsets = np.searchsorted(assign[order], np.arange(self.n_lists + 1))
+        grouped = vectors[order]
+        if quantize == "int8":
+            self.scale = np.maximum(np.abs(grouped).max(axis=0), 1e-12) / 127.0
+            self.codes = np.round(grouped / self.scale).astype(np.int8)
+        elif quantize is None:
+            self.scale = None
+            self.codes = grouped
+        else:
+            raise ValueError(f"Unknown quantization: {quantize}")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _train(self, vectors, iterations, rng):
+        # Spherical k-means on a bounded sample keeps build time predictable
+        sample_size = min(len(vectors), 64 * self.n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(self.n_lists):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        return centroids
+
+    def _assign(self, vectors, block=8192):
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            chunk = vectors[start:start + block]
+            assign[start:start + block] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assign
+
+    def search(self, query, k=1):
+        query = _normalize(query).reshape(-1)
+        probes = _top_k(self.centroids @ query, self.nprobe)
+        spans = [np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes]
+        rows = np.concatenate(spans)
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self.scale is not None:
+            scores = self.codes[rows].astype(np.float32) @ (query * self.scale)
+        else:
+            scores = self.codes[rows] @ query
+        top = _top_k(scores, k)
+        return self.ids[rows[top]], scores[top]
+
+
+INDEX_BACKENDS = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def build_index(backend, vectors, **options):
+    try:
+        index_cls = INDEX_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown index backend '{backend}', choose from {sorted(INDEX_BACKENDS)}")
+    return index_cls(vectors, **options)
+
+
+def recall_at_1(index, reference, queries):
+    """Fraction of queries where `index` returns the same top hit as `reference`."""
+    agree = 0
+    for q in queries:
+        agree += int(index.search(q, k=1)[0][0] == reference.search(q, k=1)[0][0])
+    return agree / len(queries) if len(queries) else 0.0
+
+
+if __name__ == "__main__":
+    # Recall@1 / latency check of the approximate index against exact search
+    import argparse
+    import time
+    from sentence_transformers import SentenceTransformer
+    from embedding_cache import EmbeddingCache
+    from ingest import DB_FILE
+    from kb_format import KB_FILE, open_knowledge_base
+
+    parser = argparse.ArgumentParser(description="Compare IVF recall@1 and latency against exact search.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--kb", default=KB_FILE)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    corpus_text = open_knowledge_base(args.db, args.kb).pattern_texts()
+
+    retriever = SentenceTransformer(args.model)
+    encode = lambda texts: retriever.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    vectors = EmbeddingCache(args.db, args.model).encode(corpus_text, encode)
+
+    # Queries are truncated DB patterns so they are near, but not identical to, an entry
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(corpus_text), min(args.queries, len(corpus_text)), replace=False)
+    probes = [" ".join(corpus_text[i].split()[:max(3, len(corpus_text[i].split()) // 2)]) for i in picks]
+    queries = encode(probes)
+
+    def latency_ms(index):
+        start = time.perf_counter()
+        for q in queries:
+            index.search(q, k=1)
+        return (time.perf_counter() - start) * 1000 / len(queries)
+
+    exact = ExactIndex(vectors)
+    print(f"📊 {len(exact)} entries, {len(queries)} queries")
+    print(f"   exact          recall@1=1.000  {latency_ms(exact):.3f} ms/query")
+    for quantize in (None, "int8"):
+        start = time.perf_counter()
+        ivf = IVFIndex(vectors, quantize=quantize)
+        build_s = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            ivf.nprobe = min(nprobe, ivf.n_lists)
+            label = f"ivf{'-int8' if quantize else ''} p={ivf.nprobe}"
+            print(f"   {label:<14} recall@1={recall_at_1(ivf, exact, queries):.3f}  "
+                  f"{latency_ms(ivf):.3f} ms/query  (lists={ivf.n_lists}, build {build_s:.1f}s)")